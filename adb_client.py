@@ -0,0 +1,459 @@
+"""
+Cliente do protocolo do servidor ADB (smart socket na porta 5037).
+
+Fala direto com o servidor adb local em vez de iniciar um processo `adb` por
+comando. Suporta os serviços host (version, devices, get-state, connect...),
+transport (para escolher o aparelho), shell (v2, com código de saída) e sync
+(push, pull e stat). As sessões sync ficam em um pool e são reaproveitadas.
+"""
+
+import os
+import socket
+import struct
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ADB_HOST = '127.0.0.1'
+ADB_PORT = int(os.environ.get('ANDROID_ADB_SERVER_PORT', 5037))
+DEFAULT_TIMEOUT = 10.0
+SYNC_CHUNK = 64 * 1024  # tamanho máximo de um bloco DATA do protocolo sync
+SYNC_POOL_SIZE = 2  # sessões sync ociosas mantidas por aparelho
+SYNC_IDLE_TIMEOUT = 30.0  # sessões ociosas há mais tempo que isso são descartadas
+
+# Pacotes do shell v2: id (1 byte) + tamanho (u32 little-endian) + dados
+SHELL_STDOUT, SHELL_STDERR, SHELL_EXIT = 1, 2, 3
+SHELL_HEADER = struct.Struct('<BI')
+# Marcador usado no shell v1 (aparelhos sem shell_v2) para recuperar o código de saída
+EXIT_MARKER = '\x1fADB_EXIT:'
+
+
+class ADBError(Exception):
+    """Falha informada pelo servidor ADB (resposta FAIL) ou pelo aparelho"""
+
+
+class ADBConnectionError(ADBError):
+    """Servidor ADB inacessível (não está rodando ou porta errada)"""
+
+
+class ADBClosedError(ADBError):
+    """Conexão encerrada no meio de uma resposta"""
+
+
+@dataclass
+class ShellResult:
+    """Resultado de um comando shell, com os mesmos campos do subprocess.run"""
+    returncode: int
+    stdout: str
+    stderr: str = ''
+
+    def check_returncode(self):
+        if self.returncode != 0:
+            raise ADBError((self.stderr or self.stdout).strip() or f"Código de saída {self.returncode}")
+
+
+@dataclass
+class SyncStat:
+    mode: int
+    size: int
+    mtime: int
+
+    @property
+    def exists(self) -> bool:
+        return self.mode != 0
+
+
+class ADBConnection:
+    """Uma conexão TCP com o servidor ADB"""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        try:
+            self.sock = socket.create_connection((host, port), timeout=timeout)
+        except OSError as e:
+            raise ADBConnectionError(f"Servidor ADB inacessível em {host}:{port}: {e}") from e
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send_request(self, service: str):
+        """Envia um pedido (tamanho em 4 dígitos hexadecimais + serviço) e confere o OKAY"""
+        data = service.encode('utf-8')
+        self.sock.sendall(b'%04x' % len(data) + data)
+        self.check_status()
+
+    def check_status(self):
+        status = self.read_exactly(4)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            raise ADBError(self.read_hex_string())
+        raise ADBError(f"Resposta inesperada do servidor ADB: {status!r}")
+
+    def read_exactly(self, size: int) -> bytes:
+        buffer = bytearray()
+        while len(buffer) < size:
+            chunk = self.sock.recv(size - len(buffer))
+            if not chunk:
+                raise ADBClosedError("Conexão encerrada pelo servidor ADB")
+            buffer += chunk
+        return bytes(buffer)
+
+    def read_hex_string(self) -> str:
+        """Lê uma resposta no formato tamanho hexadecimal + texto"""
+        size = int(self.read_exactly(4), 16)
+        return self.read_exactly(size).decode('utf-8', 'replace')
+
+    def read_all(self) -> bytes:
+        """Lê até o servidor fechar a conexão"""
+        chunks = []
+        while True:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def settimeout(self, timeout: Optional[float]):
+        self.sock.settimeout(timeout)
+
+    def close(self):
+        # shutdown antes do close acorda uma thread bloqueada lendo desta conexão
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class SyncSession:
+    """Sessão do serviço sync: vários push/pull/stat na mesma conexão"""
+
+    def __init__(self, connection: ADBConnection):
+        self.connection = connection
+        self.last_used = time.monotonic()
+
+    def _send(self, command: bytes, data: bytes = b''):
+        self.connection.sock.sendall(command + struct.pack('<I', len(data)) + data)
+
+    def _read_header(self) -> Tuple[bytes, int]:
+        header = self.connection.read_exactly(8)
+        return header[:4], struct.unpack('<I', header[4:])[0]
+
+    def _fail(self, size: int):
+        raise ADBError(self.connection.read_exactly(size).decode('utf-8', 'replace'))
+
+    def stat(self, remote: str) -> SyncStat:
+        self._send(b'STAT', remote.encode('utf-8'))
+        reply = self.connection.read_exactly(16)
+        if reply[:4] != b'STAT':
+            raise ADBError(f"Resposta inesperada ao STAT: {reply[:4]!r}")
+        return SyncStat(*struct.unpack('<III', reply[4:]))
+
+    def push(self, local: str, remote: str, mode: int = 0o644) -> int:
+        """Envia um arquivo local; retorna o número de bytes enviados"""
+        sent = 0
+        self._send(b'SEND', f"{remote},{mode}".encode('utf-8'))
+        with open(local, 'rb') as f:
+            while True:
+                chunk = f.read(SYNC_CHUNK)
+                if not chunk:
+                    break
+                self._send(b'DATA', chunk)
+                sent += len(chunk)
+        mtime = int(os.path.getmtime(local))
+        self.connection.sock.sendall(b'DONE' + struct.pack('<I', mtime))
+        status, size = self._read_header()
+        if status == b'FAIL':
+            self._fail(size)
+        if status != b'OKAY':
+            raise ADBError(f"Resposta inesperada ao SEND: {status!r}")
+        return sent
+
+    def pull(self, remote: str, local: str) -> int:
+        """Baixa um arquivo do aparelho; retorna o número de bytes recebidos"""
+        received = 0
+        self._send(b'RECV', remote.encode('utf-8'))
+        partial = local + '.part'
+        try:
+            with open(partial, 'wb') as f:
+                while True:
+                    status, size = self._read_header()
+                    if status == b'DATA':
+                        f.write(self.connection.read_exactly(size))
+                        received += size
+                    elif status == b'DONE':
+                        break
+                    elif status == b'FAIL':
+                        self._fail(size)
+                    else:
+                        raise ADBError(f"Resposta inesperada ao RECV: {status!r}")
+            os.replace(partial, local)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return received
+
+    def close(self):
+        try:
+            self._send(b'QUIT')
+        except OSError:
+            pass
+        self.connection.close()
+
+
+class ShellSession:
+    """Comando shell em andamento (ex.: screenrecord), com a interface do
+    subprocess.Popen usada pelo app: poll(), wait() e terminate()"""
+
+    def __init__(self, connection: ADBConnection, on_output: Optional[Callable[[str], None]] = None):
+        self.connection = connection
+        self.returncode = None
+        self.on_output = on_output
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._drain, daemon=True, name='adb-shell')
+        self._thread.start()
+
+    def _drain(self):
+        # Consome a saída para o aparelho nunca bloquear escrevendo nela
+        try:
+            self.connection.settimeout(None)
+            while True:
+                chunk = self.connection.sock.recv(65536)
+                if not chunk:
+                    break
+                if self.on_output:
+                    self.on_output(chunk.decode('utf-8', 'replace'))
+        except OSError:
+            pass
+        finally:
+            if self.returncode is None:
+                self.returncode = 0
+            self.connection.close()
+            self._done.set()
+
+    def poll(self) -> Optional[int]:
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        self._done.wait(timeout)
+        return self.returncode
+
+    def terminate(self):
+        """Fecha a conexão; o adbd encerra o comando no aparelho"""
+        if self.returncode is None:
+            self.returncode = -15
+        self.connection.close()
+
+    kill = terminate
+
+
+class ADBClient:
+    """Cliente do servidor ADB. Endereço e porta são configuráveis para que os
+    testes possam apontar para um servidor falso local."""
+
+    def __init__(self, host: str = ADB_HOST, port: int = ADB_PORT, timeout: float = DEFAULT_TIMEOUT,
+                 sync_pool_size: int = SYNC_POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sync_pool_size = sync_pool_size
+        self._sync_pool: Dict[str, List[SyncSession]] = {}
+        self._features: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def connect(self, timeout: Optional[float] = None) -> ADBConnection:
+        return ADBConnection(self.host, self.port, timeout or self.timeout)
+
+    # Serviços host: o servidor responde e fecha a conexão, então cada pedido
+    # usa uma conexão nova (barata: é local e não inicia processo)
+
+    def host_query(self, service: str) -> str:
+        """Serviço host que responde com tamanho + texto (version, devices...)"""
+        connection = self.connect()
+        try:
+            connection.send_request(service)
+            return connection.read_hex_string()
+        finally:
+            connection.close()
+
+    def host_command(self, service: str):
+        """Serviço host que responde só com OKAY (ex.: host:kill)"""
+        connection = self.connect()
+        try:
+            connection.send_request(service)
+        finally:
+            connection.close()
+
+    def version(self) -> int:
+        """Versão do protocolo do servidor ADB"""
+        return int(self.host_query('host:version'), 16)
+
+    def devices(self, long: bool = False) -> List[Tuple[str, str]]:
+        """Aparelhos conhecidos pelo servidor, como (serial, estado)"""
+        return [(parts[0], parts[1]) for parts in
+                (line.split() for line in self.devices_text(long).splitlines()) if len(parts) >= 2]
+
+    def devices_text(self, long: bool = False) -> str:
+        """Lista de aparelhos no formato do `adb devices` (sem o cabeçalho)"""
+        return self.host_query('host:devices-l' if long else 'host:devices')
+
+    def get_state(self, serial: str) -> str:
+        return self.host_query(f'host-serial:{serial}:get-state')
+
+    def features(self, serial: str) -> List[str]:
+        """Recursos suportados pelo aparelho (ex.: shell_v2); consultado uma vez por serial"""
+        features = self._features.get(serial)
+        if features is None:
+            features = self._features[serial] = self.host_query(f'host-serial:{serial}:features').split(',')
+        return features
+
+    def connect_device(self, address: str) -> str:
+        """Equivalente ao `adb connect ip:porta`"""
+        return self.host_query(f'host:connect:{address}')
+
+    def disconnect_device(self, address: str) -> str:
+        return self.host_query(f'host:disconnect:{address}')
+
+    def kill_server(self):
+        self.host_command('host:kill')
+
+    # Serviços do aparelho: host:transport escolhe o aparelho e a conexão passa
+    # a falar com o adbd dele
+
+    def transport(self, serial: Optional[str], service: str, timeout: Optional[float] = None) -> ADBConnection:
+        """Abre uma conexão com um serviço do aparelho (shell:, sync:, tcpip:...)"""
+        connection = self.connect(timeout)
+        try:
+            connection.send_request(f'host:transport:{serial}' if serial else 'host:transport-any')
+            connection.send_request(service)
+            return connection
+        except Exception:
+            connection.close()
+            raise
+
+    def shell(self, serial: Optional[str], command: str, timeout: Optional[float] = None) -> ShellResult:
+        """Executa um comando e espera o fim. Usa o shell v2 (stdout, stderr e
+        código de saída separados) quando o aparelho suporta."""
+        if serial and 'shell_v2' in self.features(serial):
+            return self._shell_v2(serial, command, timeout)
+        # Shell v1 junta stdout e stderr e não informa o código de saída:
+        # o comando imprime o código depois de um marcador
+        connection = self.transport(serial, f'shell:{command}; echo "{EXIT_MARKER}$?"', timeout)
+        try:
+            output = connection.read_all().decode('utf-8', 'replace')
+        finally:
+            connection.close()
+        output, _, code = output.rpartition(EXIT_MARKER)
+        try:
+            return ShellResult(int(code.strip()), output)
+        except ValueError:
+            return ShellResult(0, output + code)
+
+    def _shell_v2(self, serial: str, command: str, timeout: Optional[float]) -> ShellResult:
+        connection = self.transport(serial, f'shell,v2,raw:{command}', timeout)
+        stdout, stderr = bytearray(), bytearray()
+        returncode = None
+        try:
+            while returncode is None:
+                try:
+                    kind, size = SHELL_HEADER.unpack(connection.read_exactly(SHELL_HEADER.size))
+                except ADBClosedError:
+                    break  # conexão fechada sem pacote de saída
+                data = connection.read_exactly(size)
+                if kind == SHELL_STDOUT:
+                    stdout += data
+                elif kind == SHELL_STDERR:
+                    stderr += data
+                elif kind == SHELL_EXIT:
+                    returncode = data[0] if data else 0
+        finally:
+            connection.close()
+        return ShellResult(returncode if returncode is not None else -1,
+                           stdout.decode('utf-8', 'replace'), stderr.decode('utf-8', 'replace'))
+
+    def open_shell(self, serial: Optional[str], command: str,
+                   on_output: Optional[Callable[[str], None]] = None) -> ShellSession:
+        """Inicia um comando longo sem esperar o fim (ex.: screenrecord)"""
+        return ShellSession(self.transport(serial, f'shell:{command}'), on_output)
+
+    def tcpip(self, serial: str, port: int = 5555) -> str:
+        """Reinicia o adbd do aparelho escutando em TCP (adb tcpip)"""
+        connection = self.transport(serial, f'tcpip:{port}')
+        try:
+            return connection.read_all().decode('utf-8', 'replace').strip()
+        finally:
+            connection.close()
+
+    # Serviço sync, com sessões reaproveitadas entre transferências
+
+    def _acquire_sync(self, serial: str) -> Tuple[SyncSession, bool]:
+        """Retorna (sessão, reaproveitada)"""
+        now = time.monotonic()
+        with self._lock:
+            pool = self._sync_pool.get(serial, [])
+            while pool:
+                session = pool.pop()
+                if now - session.last_used < SYNC_IDLE_TIMEOUT:
+                    return session, True
+                session.close()
+        return SyncSession(self.transport(serial, 'sync:')), False
+
+    def _release_sync(self, serial: str, session: SyncSession):
+        session.last_used = time.monotonic()
+        with self._lock:
+            pool = self._sync_pool.setdefault(serial, [])
+            if len(pool) < self.sync_pool_size:
+                pool.append(session)
+                return
+        session.close()
+
+    def _with_sync(self, serial: str, operation):
+        session, reused = self._acquire_sync(serial)
+        try:
+            result = operation(session)
+        except (OSError, ADBClosedError):
+            session.connection.close()
+            if not reused:
+                raise
+            # Sessão do pool que caiu (aparelho reconectado): tenta uma vez com uma nova
+            self.forget(serial)
+            session = SyncSession(self.transport(serial, 'sync:'))
+            try:
+                result = operation(session)
+            except Exception:
+                session.connection.close()
+                raise
+        except Exception:
+            session.connection.close()
+            raise
+        self._release_sync(serial, session)
+        return result
+
+    def push(self, serial: str, local: str, remote: str, mode: int = 0o644) -> int:
+        return self._with_sync(serial, lambda session: session.push(local, remote, mode))
+
+    def pull(self, serial: str, remote: str, local: str) -> int:
+        return self._with_sync(serial, lambda session: session.pull(remote, local))
+
+    def stat(self, serial: str, remote: str) -> SyncStat:
+        return self._with_sync(serial, lambda session: session.stat(remote))
+
+    def forget(self, serial: str):
+        """Descarta o estado guardado de um aparelho (sessões sync e recursos),
+        usado quando ele desconecta ou reconecta"""
+        with self._lock:
+            sessions = self._sync_pool.pop(serial, [])
+            self._features.pop(serial, None)
+        for session in sessions:
+            session.close()
+
+    def close(self):
+        with self._lock:
+            pools, self._sync_pool = self._sync_pool, {}
+        for sessions in pools.values():
+            for session in sessions:
+                session.close()
@@ -6,162 +6,424 @@ import subprocess
 import json
 import re
 import os
+import time
 import logging
-from typing import List, Dict, Optional, Tuple
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+
+from adb_client import ADBClient, ADBConnectionError, ADBError, ShellResult
+from device_registry import DeviceEvent, DeviceRegistry
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Depois que o servidor ADB fica inacessível pelo cliente nativo, os comandos usam
+# o binário e o cliente só é tentado de novo após este intervalo (segundos)
+CLIENT_RETRY_INTERVAL = 30
+
+# Informações de aparelho em cache valem por este tempo (segundos); desconectar
+# ou reconectar o aparelho descarta o cache antes disso
+DEVICE_INFO_TTL = 300
+
+# Aparelhos consultados em paralelo na enumeração; cada um tem até DEVICE_DEADLINE
+# segundos (contados do início da sua consulta) para responder
+DEVICE_WORKERS = 8
+DEVICE_DEADLINE = 5.0
+
+# Propriedades e tela lidas em uma única sessão shell; o marcador separa a saída
+# do getprop da saída do wm
+DISPLAY_MARKER = '@@display@@'
+DEVICE_INFO_COMMAND = f"getprop; echo {DISPLAY_MARKER}; wm size; wm density"
+GETPROP_LINE = re.compile(r'^\[([^\]]+)\]: \[(.*)\]$', re.MULTILINE)
+
+@dataclass
+class DeviceInfo:
+    """Propriedades de um aparelho, lidas de uma vez (getprop completo + wm)"""
+    serial: str
+    model: str = "Desconhecido"
+    brand: str = "Desconhecido"
+    version: str = "Desconhecido"
+    sdk: str = "Desconhecido"
+    resolution: str = "Desconhecida"
+    density: Optional[int] = None
+    properties: Dict[str, str] = field(default_factory=dict, repr=False)
+    fetched_at: float = field(default_factory=time.monotonic, repr=False)
+
+    @classmethod
+    def parse(cls, serial: str, output: str) -> 'DeviceInfo':
+        """Monta o registro a partir da saída do DEVICE_INFO_COMMAND"""
+        # Aparelhos sem shell_v2 (Android < 7) e o binário devolvem CRLF
+        output = output.replace('\r\n', '\n')
+        props_text, _, display = output.partition(DISPLAY_MARKER)
+        properties = dict(GETPROP_LINE.findall(props_text))
+        # Formato: "Physical size: 1920x1080" (e "Override size: ..." se alterado)
+        size = re.search(r'(\d+x\d+)', display)
+        density = re.search(r'density: (\d+)', display)
+        return cls(
+            serial=serial,
+            model=properties.get('ro.product.model') or "Desconhecido",
+            brand=properties.get('ro.product.brand') or "Desconhecido",
+            version=properties.get('ro.build.version.release') or "Desconhecido",
+            sdk=properties.get('ro.build.version.sdk') or "Desconhecido",
+            resolution=size.group(1) if size else "Desconhecida",
+            density=int(density.group(1)) if density else None,
+            properties=properties
+        )
+
+    def to_dict(self) -> Dict[str, str]:
+        """Formato usado por get_connected_devices e pelos perfis salvos"""
+        return {
+            'id': self.serial,
+            'status': 'device',
+            'model': self.model,
+            'brand': self.brand,
+            'version': self.version,
+            'sdk': self.sdk,
+            'resolution': self.resolution
+        }
+
 class ADBUtils:
-    """Classe com utilitários para comandos ADB"""
+    """Classe com utilitários para comandos ADB.
+
+    Os comandos falam direto com o servidor ADB pelo ADBClient (sem iniciar um
+    processo por comando); o binário adb só é usado para iniciar o servidor e
+    como alternativa quando o servidor não está acessível.
+    """
     
-    def __init__(self):
-        """Inicializa configurando o caminho do ADB"""
+    def __init__(self, adb_path: Optional[str] = None, client: Optional[ADBClient] = None):
+        """Só guarda a configuração: nada é executado aqui. O binário é localizado
+        e testado no primeiro uso, e o servidor ADB em execução é reaproveitado
+        (iniciado só se não estiver rodando)."""
+        self.client = client or ADBClient()
+        self.use_client = True
+        self.client_retry_at = 0.0
+        self.device_info_cache: Dict[str, DeviceInfo] = {}
+        self.device_states: Dict[str, str] = {}
+        self.cache_lock = threading.Lock()
+        self.setup_lock = threading.Lock()
+        self.device_executor: Optional[ThreadPoolExecutor] = None
+        self.registry: Optional[DeviceRegistry] = None
+        self._adb_path = adb_path
+        self.adb_checked = bool(adb_path)  # caminho dado por quem chamou (ex.: main.py) não é testado
+        self.platform_tools_dir = os.path.dirname(adb_path) if adb_path else None
+        self.using_local_adb = bool(self.platform_tools_dir)
+    
+    @property
+    def adb_path(self) -> str:
+        """Caminho do binário adb, localizado na primeira vez que é pedido"""
         self.setup_adb_path()
+        return self._adb_path
     
     def setup_adb_path(self):
-        """Configura o caminho para o ADB local"""
-        try:
-            # Determinar o diretório do script usando caminho absoluto
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            logger.info(f"Diretório do script: {script_dir}")
-            
-            # Caminho absoluto para platform-tools
-            platform_tools_dir = os.path.join(script_dir, "platform-tools")
-            logger.info(f"Diretório platform-tools: {platform_tools_dir}")
-            
-            # Determinar o executável ADB baseado no OS
-            if os.name == 'nt':  # Windows
-                self.adb_path = os.path.join(platform_tools_dir, "adb.exe")
-            else:  # Linux/Mac
-                self.adb_path = os.path.join(platform_tools_dir, "adb")
-            
-            logger.info(f"Caminho do ADB: {self.adb_path}")
-            
-            # Verificar se o arquivo existe e tem permissão de execução
-            if os.path.exists(self.adb_path):
-                logger.info("ADB local encontrado")
-                # Tentar executar adb version para verificar se funciona
-                try:
-                    os.chdir(platform_tools_dir)  # Mudar para o diretório do ADB
-                    result = subprocess.run([self.adb_path, 'version'],
-                                         capture_output=True, text=True, timeout=5)
-                    if result.returncode == 0:
-                        logger.info("ADB local funcionando corretamente")
-                        self.using_local_adb = True
-                        self.platform_tools_dir = platform_tools_dir
-                    else:
+        """Configura o caminho para o ADB local (uma única vez)"""
+        if self.adb_checked:
+            return
+        with self.setup_lock:
+            if self.adb_checked:
+                return
+            try:
+                # Determinar o diretório do script usando caminho absoluto
+                script_dir = os.path.dirname(os.path.abspath(__file__))
+                
+                # Caminho absoluto para platform-tools
+                platform_tools_dir = os.path.join(script_dir, "platform-tools")
+                
+                # Determinar o executável ADB baseado no OS
+                if os.name == 'nt':  # Windows
+                    adb_path = os.path.join(platform_tools_dir, "adb.exe")
+                else:  # Linux/Mac
+                    adb_path = os.path.join(platform_tools_dir, "adb")
+                
+                logger.info(f"Caminho do ADB: {adb_path}")
+                
+                # Verificar se o arquivo existe e funciona
+                if os.path.exists(adb_path):
+                    logger.info("ADB local encontrado")
+                    try:
+                        result = subprocess.run([adb_path, 'version'], cwd=platform_tools_dir,
+                                             capture_output=True, text=True, timeout=5)
+                        if result.returncode == 0:
+                            logger.info("ADB local funcionando corretamente")
+                            self._adb_path = adb_path
+                            self.using_local_adb = True
+                            self.platform_tools_dir = platform_tools_dir
+                            return
                         raise Exception(f"Erro ao executar ADB: {result.stderr}")
-                except Exception as e:
-                    logger.error(f"Erro ao testar ADB local: {e}")
-                    self.adb_path = "adb"
+                    except Exception as e:
+                        logger.error(f"Erro ao testar ADB local: {e}")
+                else:
+                    logger.warning("ADB local não encontrado, usando ADB do sistema")
+                
+            except Exception as e:
+                logger.error(f"Erro na configuração do ADB: {e}")
+            finally:
+                if self._adb_path is None:
+                    self._adb_path = "adb"
                     self.using_local_adb = False
-            else:
-                logger.warning("ADB local não encontrado, usando ADB do sistema")
-                self.adb_path = "adb"
-                self.using_local_adb = False
-            
-            # Tentar iniciar o servidor ADB
-            self.restart_adb_server()
-            
-        except Exception as e:
-            logger.error(f"Erro na configuração do ADB: {e}")
-            self.adb_path = "adb"
-            self.using_local_adb = False
+                    self.platform_tools_dir = None
+                self.adb_checked = True
+    
+    @property
+    def adb_cwd(self) -> Optional[str]:
+        """Diretório em que o binário roda (o do ADB local, junto das DLLs no Windows)"""
+        self.setup_adb_path()
+        return self.platform_tools_dir if self.using_local_adb else None
     
     def restart_adb_server(self):
-        """Reinicia o servidor ADB"""
+        """Reinicia o servidor ADB. Derruba as sessões de outras ferramentas que
+        usam o mesmo servidor, então só deve ser chamado a pedido do usuário."""
         try:
-            if self.using_local_adb:
-                os.chdir(self.platform_tools_dir)
-            
             # Matar servidor existente
-            subprocess.run([self.adb_path, 'kill-server'],
-                         capture_output=True, text=True, timeout=5)
+            self.client.kill_server()
             logger.info("Servidor ADB anterior finalizado")
-            
-            # Iniciar novo servidor
-            result = subprocess.run([self.adb_path, 'start-server'],
-                                  capture_output=True, text=True, timeout=5)
-            if result.returncode == 0:
-                logger.info("Servidor ADB iniciado com sucesso")
-            else:
-                logger.error(f"Erro ao iniciar servidor ADB: {result.stderr}")
-        except Exception as e:
-            logger.error(f"Erro ao manipular servidor ADB: {e}")
+        except ADBError:
+            pass  # nenhum servidor rodando
+        if self.start_server():
+            logger.info("Servidor ADB iniciado com sucesso")
     
     def get_adb_command(self, *args):
-        """Retorna comando ADB completo com argumentos"""
+        """Retorna comando ADB completo com argumentos (executar com cwd=self.adb_cwd)"""
+        cmd = [self.adb_path] + list(args)
+        logger.debug(f"Comando ADB: {' '.join(cmd)}")
+        return cmd
+    
+    def start_server(self) -> bool:
+        """Inicia o servidor ADB pelo binário (não faz nada se já estiver rodando)"""
         try:
-            if self.using_local_adb:
-                os.chdir(self.platform_tools_dir)
-            cmd = [self.adb_path] + list(args)
-            logger.debug(f"Comando ADB: {' '.join(cmd)}")
-            return cmd
+            result = subprocess.run(self.get_adb_command('start-server'), cwd=self.adb_cwd,
+                                  capture_output=True, text=True, timeout=10)
+            if result.returncode != 0:
+                logger.error(f"Erro ao iniciar servidor ADB: {result.stderr}")
+            return result.returncode == 0
         except Exception as e:
-            logger.error(f"Erro ao gerar comando ADB: {e}")
-            return [self.adb_path] + list(args)
+            logger.error(f"Erro ao iniciar servidor ADB: {e}")
+            return False
+    
+    def run_adb(self, *args, timeout: float = 10) -> ShellResult:
+        """Executa o binário adb com os argumentos dados"""
+        try:
+            result = subprocess.run(self.get_adb_command(*args), cwd=self.adb_cwd,
+                                  capture_output=True, text=True, timeout=timeout)
+            return ShellResult(result.returncode, result.stdout, result.stderr)
+        except FileNotFoundError:
+            return ShellResult(1, '', "ADB não encontrado no sistema")
+        except subprocess.TimeoutExpired:
+            return ShellResult(1, '', f"Timeout ao executar adb {' '.join(args)}")
+    
+    def execute(self, operation: Callable[[ADBClient], object], *args, timeout: float = 10) -> ShellResult:
+        """Executa uma operação pelo cliente do servidor ADB.
+        
+        `args` são os argumentos equivalentes do binário adb, usados quando o
+        servidor não está acessível. Se a conexão for recusada, o servidor é
+        iniciado pelo binário e a operação tentada mais uma vez.
+        """
+        if self.use_client or time.monotonic() >= self.client_retry_at:
+            for attempt in range(2):
+                try:
+                    result = operation(self.client)
+                    self.use_client = True
+                    if isinstance(result, ShellResult):
+                        return result
+                    return ShellResult(0, '' if result is None else str(result))
+                except ADBConnectionError as e:
+                    if attempt == 0 and self.start_server():
+                        continue
+                    logger.warning(f"Servidor ADB inacessível pelo cliente nativo, usando o binário: {e}")
+                    self.use_client = False
+                    self.client_retry_at = time.monotonic() + CLIENT_RETRY_INTERVAL
+                    break
+                except (ADBError, OSError) as e:
+                    # Falha do comando (aparelho offline, arquivo inexistente, timeout...)
+                    return ShellResult(1, '', str(e))
+        return self.run_adb(*args, timeout=timeout)
+    
+    def version(self) -> ShellResult:
+        """Equivalente ao `adb version`"""
+        return self.execute(lambda client: f"Android Debug Bridge version 1.0.{client.version()}",
+                            'version', timeout=5)
+    
+    def devices(self, long: bool = False) -> ShellResult:
+        """Equivalente ao `adb devices` (com `-l` se long=True)"""
+        return self.execute(lambda client: "List of devices attached\n" + client.devices_text(long),
+                            'devices', *(['-l'] if long else []))
+    
+    def list_devices(self, long: bool = False) -> List[Tuple[str, str]]:
+        """Aparelhos conhecidos pelo servidor, como (serial, estado)"""
+        if self.registry and self.registry.ready.is_set():
+            # Lista mantida pelo stream do servidor, sem consulta
+            return list(self.registry.snapshot().items())
+        result = self.devices(long)
+        if result.returncode != 0:
+            logger.error(f"Erro ao listar dispositivos: {result.stderr.strip()}")
+            return []
+        devices = [(parts[0], parts[1]) for parts in
+                   (line.split() for line in result.stdout.strip().split('\n')[1:]) if len(parts) >= 2]
+        self.update_device_states(devices)
+        return devices
+    
+    def update_device_states(self, devices: List[Tuple[str, str]]):
+        """Registra o estado atual dos aparelhos; quem sumiu ou mudou de estado
+        (desconectou, reconectou, ficou offline) perde o cache de informações"""
+        current = dict(devices)
+        with self.cache_lock:
+            for serial, state in self.device_states.items():
+                if current.get(serial) != state:
+                    self.invalidate_device(serial)
+            for serial in current.keys() - self.device_states.keys():
+                self.invalidate_device(serial)
+            self.device_states = current
+    
+    def start_tracking(self) -> DeviceRegistry:
+        """Passa a acompanhar os aparelhos pelo stream do servidor ADB
+        (host:track-devices). Pode ser chamado mais de uma vez."""
+        with self.cache_lock:
+            created = self.registry is None
+            if created:
+                self.registry = DeviceRegistry(self.client, self.get_adb_command, self.start_server,
+                                               adb_cwd=lambda: self.adb_cwd)
+        if created:
+            self.registry.subscribe(self.on_device_event)
+        return self.registry.start()
+    
+    def on_device_event(self, event: DeviceEvent):
+        """Aparelho que entrou, saiu ou mudou de estado perde o cache"""
+        with self.cache_lock:
+            self.invalidate_device(event.serial)
+            if event.state is None:
+                self.device_states.pop(event.serial, None)
+            else:
+                self.device_states[event.serial] = event.state
+    
+    def invalidate_device(self, device_id: str):
+        """Descarta o que está guardado sobre o aparelho"""
+        self.device_info_cache.pop(device_id, None)
+        self.client.forget(device_id)
+    
+    def get_device_info(self, device_id: str, max_age: float = DEVICE_INFO_TTL,
+                        timeout: float = DEVICE_DEADLINE) -> Optional[DeviceInfo]:
+        """Informações do aparelho, do cache se tiverem menos de `max_age` segundos;
+        senão lidas em uma única sessão shell"""
+        info = self.device_info_cache.get(device_id)
+        if info and time.monotonic() - info.fetched_at < max_age:
+            return info
+        result = self.shell(device_id, DEVICE_INFO_COMMAND, timeout=timeout)
+        info = DeviceInfo.parse(device_id, result.stdout)
+        if not info.properties:
+            logger.error(f"Erro ao ler propriedades de {device_id}: {result.stderr.strip()}")
+            return None
+        with self.cache_lock:
+            self.device_info_cache[device_id] = info
+        return info
+    
+    def get_state(self, device_id: str) -> ShellResult:
+        """Equivalente ao `adb -s <id> get-state`"""
+        return self.execute(lambda client: client.get_state(device_id), '-s', device_id, 'get-state')
+    
+    def shell(self, device_id: str, *args, timeout: float = 10) -> ShellResult:
+        """Executa um comando no aparelho e espera o fim (como `adb -s <id> shell ...`)"""
+        return self.execute(lambda client: client.shell(device_id, ' '.join(args), timeout),
+                            '-s', device_id, 'shell', *args, timeout=timeout)
+    
+    def start_shell(self, device_id: str, *args, on_output: Optional[Callable[[str], None]] = None):
+        """Inicia um comando longo no aparelho sem esperar o fim (ex.: screenrecord).
+        Retorna um objeto com poll(), wait() e terminate()"""
+        if self.use_client or time.monotonic() >= self.client_retry_at:
+            try:
+                return self.client.open_shell(device_id, ' '.join(args), on_output)
+            except ADBConnectionError as e:
+                logger.warning(f"Servidor ADB inacessível pelo cliente nativo, usando o binário: {e}")
+        return subprocess.Popen(self.get_adb_command('-s', device_id, 'shell', *args), cwd=self.adb_cwd,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    
+    def push(self, device_id: str, local: str, remote: str) -> ShellResult:
+        """Envia um arquivo para o aparelho (adb push)"""
+        return self.execute(lambda client: f"{local}: {client.push(device_id, local, remote)} bytes",
+                            '-s', device_id, 'push', local, remote, timeout=120)
+    
+    def pull(self, device_id: str, remote: str, local: str) -> ShellResult:
+        """Baixa um arquivo do aparelho (adb pull)"""
+        return self.execute(lambda client: f"{remote}: {client.pull(device_id, remote, local)} bytes",
+                            '-s', device_id, 'pull', remote, local, timeout=600)
     
     def check_adb_available(self) -> bool:
         """Verifica se ADB está disponível no sistema"""
         try:
-            result = subprocess.run(self.get_adb_command('version'), 
-                                  capture_output=True, text=True, timeout=5)
+            result = self.version()
             if result.returncode == 0:
                 logger.info(f"ADB disponível: {result.stdout.strip()}")
                 return True
             else:
                 logger.error(f"Erro ao verificar ADB: {result.stderr}")
                 return False
-        except FileNotFoundError:
-            logger.error("ADB não encontrado no sistema")
-            return False
-        except subprocess.TimeoutExpired:
-            logger.error("Timeout ao verificar ADB")
-            return False
         except Exception as e:
             logger.error(f"Erro inesperado ao verificar ADB: {e}")
             return False
     
-    def get_connected_devices(self) -> List[Dict[str, str]]:
-        """Retorna lista de dispositivos conectados com informações detalhadas"""
+    def get_device_executor(self) -> ThreadPoolExecutor:
+        """Pool das consultas a aparelhos, criado no primeiro uso"""
+        with self.cache_lock:
+            if self.device_executor is None:
+                self.device_executor = ThreadPoolExecutor(max_workers=DEVICE_WORKERS,
+                                                          thread_name_prefix='adb-device')
+            return self.device_executor
+    
+    def iter_connected_devices(self, deadline: float = DEVICE_DEADLINE) -> Iterator[Dict[str, str]]:
+        """Gera as informações de cada aparelho conectado assim que ele responde.
+        
+        Os aparelhos são consultados em paralelo; um aparelho que não responde em
+        `deadline` segundos sai com as informações desconhecidas, sem atrasar os outros.
+        """
+        # Uma consulta para a lista e uma sessão shell por aparelho (ou nenhuma,
+        # se as informações estiverem em cache)
+        serials = [device_id for device_id, state in self.list_devices(long=True) if state == 'device']
+        started: Dict[str, float] = {}
+        
+        def probe(device_id: str) -> Dict[str, str]:
+            started[device_id] = time.monotonic()
+            info = self.get_device_info(device_id, timeout=deadline)
+            return info.to_dict() if info else DeviceInfo(device_id).to_dict()
+        
+        executor = self.get_device_executor()
+        futures = {executor.submit(probe, device_id): device_id for device_id in serials}
+        pending = set(futures)
+        while pending:
+            # Espera até o próximo resultado ou até o prazo do aparelho mais antigo
+            now = time.monotonic()
+            running = [started[futures[future]] for future in pending if futures[future] in started]
+            timeout = max(0.0, min(running) + deadline - now) if running else deadline
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    yield future.result()
+                except Exception as e:
+                    logger.error(f"Erro ao consultar {futures[future]}: {e}")
+                    yield DeviceInfo(futures[future]).to_dict()
+            
+            now = time.monotonic()
+            for future in list(pending):
+                device_id = futures[future]
+                if device_id in started and now - started[device_id] >= deadline:
+                    pending.discard(future)
+                    logger.warning(f"Dispositivo {device_id} não respondeu em {deadline}s")
+                    yield DeviceInfo(device_id).to_dict()
+    
+    def get_connected_devices(self, deadline: float = DEVICE_DEADLINE,
+                              on_device: Optional[Callable[[Dict[str, str]], None]] = None) -> List[Dict[str, str]]:
+        """Retorna lista de dispositivos conectados com informações detalhadas.
+        
+        `on_device` é chamado com cada aparelho assim que ele responde, para quem
+        quiser mostrar resultados parciais.
+        """
         devices = []
         try:
-            # Verificar se ADB está disponível
-            if not self.check_adb_available():
-                logger.error("ADB não está disponível")
-                return devices
-            
-            # Listar dispositivos
-            result = subprocess.run(self.get_adb_command('devices', '-l'),
-                                  capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
-                logger.info(f"Saída do comando devices: {result.stdout}")
-                lines = result.stdout.strip().split('\n')[1:]  # Pular primeira linha
-                
-                for line in lines:
-                    if line.strip() and '\tdevice' in line:
-                        parts = line.split()
-                        device_id = parts[0]
-                        logger.info(f"Dispositivo encontrado: {device_id}")
-                        
-                        # Obter informações adicionais
-                        device_info = {
-                            'id': device_id,
-                            'status': 'device',
-                            'model': self.get_device_property(device_id, 'ro.product.model'),
-                            'brand': self.get_device_property(device_id, 'ro.product.brand'),
-                            'version': self.get_device_property(device_id, 'ro.build.version.release'),
-                            'sdk': self.get_device_property(device_id, 'ro.build.version.sdk'),
-                            'resolution': self.get_screen_resolution(device_id)
-                        }
-                        logger.info(f"Informações do dispositivo: {device_info}")
-                        devices.append(device_info)
-            else:
-                logger.error(f"Erro ao listar dispositivos: {result.stderr}")
-                
+            for device_info in self.iter_connected_devices(deadline):
+                logger.info(f"Informações do dispositivo: {device_info}")
+                devices.append(device_info)
+                if on_device:
+                    on_device(device_info)
         except Exception as e:
             logger.error(f"Erro ao obter dispositivos: {e}")
         
@@ -170,12 +432,9 @@ class ADBUtils:
     def get_device_property(self, device_id: str, property_name: str) -> str:
         """Obtém propriedade específica do dispositivo"""
         try:
-            result = subprocess.run(
-                self.get_adb_command('-s', device_id, 'shell', 'getprop', property_name),
-                capture_output=True, text=True, timeout=5
-            )
-            if result.returncode == 0:
-                return result.stdout.strip()
+            info = self.get_device_info(device_id)
+            if info and info.properties.get(property_name):
+                return info.properties[property_name]
         except Exception:
             pass
         return "Desconhecido"
@@ -183,15 +442,9 @@ class ADBUtils:
     def get_screen_resolution(self, device_id: str) -> str:
         """Obtém resolução da tela do dispositivo"""
         try:
-            result = subprocess.run(
-                self.get_adb_command('-s', device_id, 'shell', 'wm', 'size'),
-                capture_output=True, text=True, timeout=5
-            )
-            if result.returncode == 0:
-                # Formato: "Physical size: 1920x1080"
-                match = re.search(r'(\d+x\d+)', result.stdout)
-                if match:
-                    return match.group(1)
+            info = self.get_device_info(device_id)
+            if info:
+                return info.resolution
         except Exception:
             pass
         return "Desconhecida"
@@ -199,10 +452,7 @@ class ADBUtils:
     def get_device_storage_info(self, device_id: str) -> Dict[str, str]:
         """Obtém informações de armazenamento do dispositivo"""
         try:
-            result = subprocess.run(
-                self.get_adb_command('-s', device_id, 'shell', 'df', '/sdcard'),
-                capture_output=True, text=True, timeout=5
-            )
+            result = self.shell(device_id, 'df', '/sdcard', timeout=5)
             if result.returncode == 0:
                 lines = result.stdout.strip().split('\n')
                 if len(lines) > 1:
@@ -240,10 +490,7 @@ class ADBUtils:
         """Testa se o dispositivo suporta gravação de tela"""
         try:
             # Testar comando screenrecord com help
-            result = subprocess.run(
-                self.get_adb_command('-s', device_id, 'shell', 'screenrecord', '--help'),
-                capture_output=True, text=True, timeout=10
-            )
+            result = self.shell(device_id, 'screenrecord', '--help', timeout=10)
             
             if result.returncode == 0:
                 return True, "Suporte completo"
@@ -291,12 +538,13 @@ class ADBUtils:
         """Conecta ao dispositivo via Wi-Fi"""
         try:
             # Primeiro, tentar conectar
-            result = subprocess.run(
-                self.get_adb_command('connect', f'{ip_address}:{port}'),
-                capture_output=True, text=True, timeout=15
-            )
+            address = f'{ip_address}:{port}'
+            result = self.execute(lambda client: client.connect_device(address),
+                                  'connect', address, timeout=15)
             
             if 'connected' in result.stdout.lower():
+                with self.cache_lock:
+                    self.invalidate_device(address)
                 return True, f"Conectado via Wi-Fi: {ip_address}:{port}"
             else:
                 return False, f"Falha na conexão: {result.stdout.strip()}"
@@ -307,10 +555,10 @@ class ADBUtils:
     def disconnect_device(self, device_id: str) -> bool:
         """Desconecta dispositivo específico"""
         try:
-            result = subprocess.run(
-                self.get_adb_command('disconnect', device_id),
-                capture_output=True, text=True, timeout=10
-            )
+            result = self.execute(lambda client: client.disconnect_device(device_id),
+                                  'disconnect', device_id)
+            with self.cache_lock:
+                self.invalidate_device(device_id)
             return result.returncode == 0
         except Exception:
             return False
@@ -318,10 +566,8 @@ class ADBUtils:
     def enable_wifi_adb(self, device_id: str, port: int = 5555) -> Tuple[bool, str]:
         """Ativa ADB via Wi-Fi no dispositivo (requer conexão USB primeiro)"""
         try:
-            result = subprocess.run(
-                self.get_adb_command('-s', device_id, 'tcpip', str(port)),
-                capture_output=True, text=True, timeout=10
-            )
+            result = self.execute(lambda client: client.tcpip(device_id, port),
+                                  '-s', device_id, 'tcpip', str(port))
             
             if result.returncode == 0:
                 return True, f"ADB via Wi-Fi ativado na porta {port}"
@@ -334,10 +580,7 @@ class ADBUtils:
     def get_device_ip(self, device_id: str) -> Optional[str]:
         """Obtém IP do dispositivo na rede Wi-Fi"""
         try:
-            result = subprocess.run(
-                self.get_adb_command('-s', device_id, 'shell', 'ip', 'addr', 'show', 'wlan0'),
-                capture_output=True, text=True, timeout=10
-            )
+            result = self.shell(device_id, 'ip', 'addr', 'show', 'wlan0')
             
             if result.returncode == 0:
                 # Procurar por padrão IP
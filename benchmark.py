@@ -0,0 +1,226 @@
+"""
+Benchmark da captura/codificação do servidor de segunda tela.
+Usa telas sintéticas no lugar do mss, então roda em Linux sem monitor.
+
+Exemplo:
+    python benchmark.py --resolutions 1280x720,1920x1080 --qualities 50,70 --output resultado.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import screen_server
+from synthetic_screen import SyntheticScreen, SOURCES
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+def git_commit():
+    """Commit atual, para comparar resultados entre versões"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, timeout=5, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if result.returncode == 0:
+            return result.stdout.strip()
+    except Exception:
+        pass
+    return None
+
+def capture_frame(capture, detector, quality):
+    """Mesmo caminho do produtor: captura, detecção de mudança, conversão e codificação"""
+    screen = screen_server.grab_screen(capture, 1, detector)
+    if screen is None:
+        return None
+    return screen_server.encode_screen(screen, quality).encode(quality)
+
+def bench_capture(kind, resolution, quality, frames):
+    """Mede capture/encode frame a frame"""
+    capture = SyntheticScreen(kind, *resolution)
+    detector = screen_server.ChangeDetector()
+    for _ in range(3):
+        capture_frame(capture, detector, quality)  # aquecimento
+    screen_server.metrics.histograms.clear()
+
+    latencies = []
+    sizes = []
+    start = time.perf_counter()
+    for _ in range(frames):
+        frame_start = time.perf_counter()
+        data = capture_frame(capture, detector, quality)
+        latencies.append((time.perf_counter() - frame_start) * 1000)
+        if data:
+            sizes.append(len(data))
+    elapsed = time.perf_counter() - start
+
+    stages = {}
+    for (name, labels), hist in screen_server.metrics.histograms.items():
+        if name.endswith('_ms'):
+            snap = hist.snapshot()
+            stages[name] = {'p50': snap.get('p50'), 'p99': snap.get('p99')}
+
+    # Alocações rastreadas pelo tracemalloc (objetos Python, como os bytes do
+    # JPEG); os pixels das imagens do Pillow ficam fora dessa contagem
+    samples = min(frames, 20)
+    tracemalloc.start()
+    peaks = []
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        capture_frame(capture, detector, quality)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    return {
+        'benchmark': 'capture',
+        'source': kind,
+        'resolution': f"{resolution[0]}x{resolution[1]}",
+        'quality': quality,
+        'frames': frames,
+        'encoded_frames': len(sizes),
+        'fps': round(frames / elapsed, 2),
+        'latency_ms': {'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99)},
+        'stages_ms': stages,
+        'bytes_per_frame': round(sum(sizes) / len(sizes)) if sizes else 0,
+        'alloc_peak_kb_per_frame': round(sum(peaks) / len(peaks) / 1024, 1) if peaks else 0
+    }
+
+def bench_stream(kind, resolution, quality, seconds):
+    """Mede o gen_frames completo (produtor compartilhado + cliente) sem limite de FPS"""
+    screen_server.CAPTURE_SOURCE = kind
+    screen_server.SYNTHETIC_RESOLUTION = resolution
+    screen_server.JPEG_QUALITY = quality
+    screen_server.SIMULCAST = False  # mede a qualidade pedida, não as camadas
+    screen_server.TARGET_FPS = screen_server.MAX_FPS
+    screen_server.hubs.clear()
+
+    stream = screen_server.gen_frames(adaptive=False)
+    arrivals = []
+    total_bytes = 0
+    start = time.perf_counter()
+    try:
+        for chunk in stream:
+            # Cada frame sai como boundary, cabeçalhos, JPEG e CRLF; o JPEG é o maior pedaço
+            if len(chunk) > 256:
+                arrivals.append(time.perf_counter())
+                total_bytes += len(chunk)
+            if time.perf_counter() - start >= seconds:
+                break
+    finally:
+        stream.close()
+    elapsed = time.perf_counter() - start
+    intervals = [(b - a) * 1000 for a, b in zip(arrivals, arrivals[1:])]
+
+    return {
+        'benchmark': 'stream',
+        'source': kind,
+        'resolution': f"{resolution[0]}x{resolution[1]}",
+        'quality': quality,
+        'seconds': round(elapsed, 2),
+        'frames': len(arrivals),
+        'fps': round(len(arrivals) / elapsed, 2),
+        'interval_ms': {'p50': percentile(intervals, 0.5), 'p99': percentile(intervals, 0.99)},
+        'bytes_per_frame': round(total_bytes / len(arrivals)) if arrivals else 0
+    }
+
+def bench_strips(kind, resolution, quality, frames):
+    """Compara a codificação do frame inteiro com a das faixas em paralelo (modo strips)"""
+    capture = SyntheticScreen(kind, *resolution)
+    images = [screen_server.screen_to_image(capture.grab(capture.monitors[1])) for _ in range(frames + 1)]
+    tiler = screen_server.TileEncoder(quality=quality, strips=screen_server.STRIP_WORKERS,
+                                      executor=screen_server.get_strip_executor())
+    tiler.update(images[0], 1)  # aquecimento do pool
+
+    full = []
+    strips = []
+    for version, img in enumerate(images[1:], 2):
+        start = time.perf_counter()
+        screen_server.encode_jpeg(img, quality)
+        full.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        tiler.update(img, version)
+        strips.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'benchmark': 'strips',
+        'source': kind,
+        'resolution': f"{resolution[0]}x{resolution[1]}",
+        'quality': quality,
+        'frames': frames,
+        'strips': screen_server.STRIP_WORKERS,
+        'full_frame_ms': {'p50': percentile(full, 0.5), 'p99': percentile(full, 0.99)},
+        'strips_ms': {'p50': percentile(strips, 0.5), 'p99': percentile(strips, 0.99)},
+        'speedup': round(percentile(full, 0.5) / percentile(strips, 0.5), 2) if strips else None
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de captura/codificação com telas sintéticas")
+    parser.add_argument('--sources', default=','.join(SOURCES), help="Fontes sintéticas (static,scroll,motion)")
+    parser.add_argument('--resolutions', default='1280x720,1920x1080', help="Resoluções, ex.: 1920x1080,2560x1440")
+    parser.add_argument('--qualities', default='50,70,85', help="Qualidades JPEG")
+    parser.add_argument('--frames', type=int, default=60, help="Frames medidos por combinação")
+    parser.add_argument('--stream-seconds', type=float, default=0,
+                        help="Também mede o gen_frames por este tempo (0 = não mede)")
+    parser.add_argument('--strips', action='store_true',
+                        help="Também compara o frame inteiro com as faixas codificadas em paralelo")
+    parser.add_argument('--encoder', choices=('auto',) + tuple(screen_server.ENCODER_BACKENDS),
+                        default='pillow', help="Codificador JPEG (auto = o mais rápido no teste de inicialização)")
+    parser.add_argument('--subsampling', choices=screen_server.SUBSAMPLINGS,
+                        default=screen_server.JPEG_SUBSAMPLING, help="Subamostragem de cor do JPEG")
+    parser.add_argument('--output', help="Arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    logging.getLogger('screen_server').setLevel(logging.WARNING)
+    encoder = screen_server.select_encoder(args.encoder, args.subsampling)
+    sources = [source for source in args.sources.split(',') if source]
+    resolutions = [parse_resolution(text) for text in args.resolutions.split(',') if text]
+    qualities = [int(text) for text in args.qualities.split(',') if text]
+
+    results = []
+    for kind in sources:
+        for resolution in resolutions:
+            for quality in qualities:
+                print(f"capture: {kind} {resolution[0]}x{resolution[1]} q{quality}", file=sys.stderr)
+                results.append(bench_capture(kind, resolution, quality, args.frames))
+                if args.stream_seconds > 0:
+                    print(f"stream: {kind} {resolution[0]}x{resolution[1]} q{quality}", file=sys.stderr)
+                    results.append(bench_stream(kind, resolution, quality, args.stream_seconds))
+                if args.strips:
+                    print(f"strips: {kind} {resolution[0]}x{resolution[1]} q{quality}", file=sys.stderr)
+                    results.append(bench_strips(kind, resolution, quality, args.frames))
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'encode_workers': screen_server.ENCODE_WORKERS,
+        'strip_workers': screen_server.STRIP_WORKERS,
+        'encoder': encoder.name,
+        'subsampling': encoder.subsampling,
+        'results': results
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"Resultados salvos em {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
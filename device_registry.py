@@ -0,0 +1,193 @@
+"""
+Registro de aparelhos alimentado pelo servidor ADB (host:track-devices).
+
+O servidor envia a lista completa de aparelhos sempre que algo muda; o registro
+compara com a lista anterior e avisa os inscritos com eventos de entrada, saída
+e mudança de estado, sem consultas periódicas nem processos por atualização.
+"""
+
+import subprocess
+import threading
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from adb_client import ADBClient, ADBClosedError, ADBConnectionError
+
+logger = logging.getLogger(__name__)
+
+# Espera entre tentativas de reconectar ao servidor ADB (segundos, dobra até o máximo)
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 10.0
+
+ADDED, REMOVED, CHANGED = 'added', 'removed', 'changed'
+
+
+@dataclass
+class DeviceEvent:
+    kind: str  # ADDED, REMOVED ou CHANGED
+    serial: str
+    state: Optional[str]  # estado atual (None quando o aparelho saiu)
+    previous: Optional[str] = None  # estado anterior (None quando o aparelho entrou)
+
+
+def parse_device_list(text: str) -> Dict[str, str]:
+    """Lista no formato do servidor ("serial<TAB>estado" por linha) -> {serial: estado}"""
+    return {parts[0]: parts[1] for parts in (line.split() for line in text.splitlines()) if len(parts) >= 2}
+
+
+class DeviceRegistry:
+    """Lista de aparelhos mantida pelo stream do servidor ADB.
+
+    Usa o cliente nativo; se o servidor não estiver acessível, tenta iniciá-lo
+    (start_server) e, se ainda assim falhar, lê o mesmo stream de um processo
+    `adb track-devices` (adb_command monta o comando do binário e adb_cwd
+    informa o diretório em que ele roda).
+    """
+
+    def __init__(self, client: ADBClient, adb_command: Optional[Callable[..., List[str]]] = None,
+                 start_server: Optional[Callable[[], bool]] = None,
+                 adb_cwd: Optional[Callable[[], Optional[str]]] = None):
+        self.client = client
+        self.adb_command = adb_command
+        self.start_server = start_server
+        self.adb_cwd = adb_cwd
+        self.devices: Dict[str, str] = {}
+        self.subscribers: List[Callable[[DeviceEvent], None]] = []
+        self.lock = threading.Lock()
+        self.ready = threading.Event()  # primeira lista recebida
+        self.stopped = threading.Event()
+        self.thread = None
+        self.connection = None
+        self.process = None
+
+    def subscribe(self, callback: Callable[[DeviceEvent], None], replay: bool = True):
+        """Inscreve um ouvinte; com replay, ele recebe ADDED para os aparelhos já conhecidos.
+        O callback roda na thread do registro."""
+        with self.lock:
+            self.subscribers.append(callback)
+            current = dict(self.devices)
+        if replay:
+            for serial, state in current.items():
+                self._notify(callback, DeviceEvent(ADDED, serial, state))
+
+    def unsubscribe(self, callback: Callable[[DeviceEvent], None]):
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    def snapshot(self) -> Dict[str, str]:
+        with self.lock:
+            return dict(self.devices)
+
+    def wait_ready(self, timeout: float) -> bool:
+        return self.ready.wait(timeout)
+
+    def start(self) -> 'DeviceRegistry':
+        if self.thread is None or not self.thread.is_alive():
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True, name='adb-track-devices')
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        connection, process = self.connection, self.process
+        if connection:
+            connection.close()
+        if process and process.poll() is None:
+            process.terminate()
+
+    def update(self, devices: Dict[str, str]):
+        """Aplica uma lista completa e avisa as diferenças"""
+        events = []
+        with self.lock:
+            for serial, state in devices.items():
+                previous = self.devices.get(serial)
+                if previous is None:
+                    events.append(DeviceEvent(ADDED, serial, state))
+                elif previous != state:
+                    events.append(DeviceEvent(CHANGED, serial, state, previous))
+            for serial, previous in self.devices.items():
+                if serial not in devices:
+                    events.append(DeviceEvent(REMOVED, serial, None, previous))
+            self.devices = dict(devices)
+            subscribers = list(self.subscribers)
+        for event in events:
+            logger.info(f"Dispositivo {event.serial}: {event.kind} ({event.previous} -> {event.state})")
+            for callback in subscribers:
+                self._notify(callback, event)
+
+    def _notify(self, callback, event: DeviceEvent):
+        try:
+            callback(event)
+        except Exception as e:
+            logger.error(f"Erro ao notificar evento de dispositivo: {e}")
+
+    def _run(self):
+        delay = RETRY_DELAY
+        while not self.stopped.is_set():
+            try:
+                self._track()
+                delay = RETRY_DELAY
+            except Exception as e:
+                if not self.stopped.is_set():
+                    logger.error(f"Erro ao acompanhar dispositivos: {e}")
+            if self.stopped.is_set():
+                break
+            # Stream encerrado (servidor reiniciado ou parado): sem servidor não há
+            # aparelhos; a lista volta quando a conexão for refeita
+            self.update({})
+            self.ready.clear()
+            self.stopped.wait(delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def _track(self):
+        try:
+            self._track_native()
+        except ADBConnectionError as e:
+            if self.start_server and self.start_server():
+                self._track_native()
+            elif self.adb_command:
+                logger.warning(f"Servidor ADB inacessível pelo cliente nativo, usando adb track-devices: {e}")
+                self._track_binary()
+            else:
+                raise
+
+    def _track_native(self):
+        connection = self.client.connect()
+        self.connection = connection
+        try:
+            connection.send_request('host:track-devices')
+            connection.settimeout(None)  # o stream fica aberto; stop() fecha a conexão
+            while not self.stopped.is_set():
+                self._received(connection.read_hex_string())
+        except ADBClosedError:
+            if not self.stopped.is_set():
+                logger.warning("Servidor ADB encerrou o acompanhamento de dispositivos")
+        except OSError:
+            if not self.stopped.is_set():
+                raise
+        finally:
+            self.connection = None
+            connection.close()
+
+    def _track_binary(self):
+        # O binário repassa o stream do servidor: tamanho em hexadecimal + lista
+        process = subprocess.Popen(self.adb_command('track-devices'), stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, cwd=self.adb_cwd() if self.adb_cwd else None)
+        self.process = process
+        try:
+            while not self.stopped.is_set():
+                size = process.stdout.read(4)
+                if len(size) < 4:
+                    break
+                self._received(process.stdout.read(int(size, 16)).decode('utf-8', 'replace'))
+        finally:
+            self.process = None
+            if process.poll() is None:
+                process.terminate()
+
+    def _received(self, text: str):
+        self.update(parse_device_list(text))
+        self.ready.set()
@@ -0,0 +1,356 @@
+"""
+Teste de carga do /video_feed: abre N espectadores simulados (com velocidade de
+link e ritmo de leitura configuráveis) contra um servidor com fonte sintética e
+mede FPS, latência e vazão por cliente, além de CPU e RSS do servidor.
+
+Exemplos:
+    python loadtest.py --clients 20 --duration 30 --link 0,4000,1000
+    python loadtest.py --url http://192.168.0.10:5000 --clients 8 --server-pid 1234
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+from benchmark import percentile, parse_resolution, git_commit
+
+# Buffer de recepção pequeno, como o de um celular em Wi-Fi: o servidor sente a
+# lentidão do cliente em vez de tudo ficar acumulado no kernel
+DEFAULT_RCVBUF = 64 * 1024
+
+class PacedReader:
+    """Lê do socket sem ultrapassar a velocidade do link simulado (kbit/s; 0 = sem limite)"""
+
+    def __init__(self, sock, kbps=0):
+        self.sock = sock
+        self.rate = kbps * 1000 / 8
+        self.buffer = bytearray()
+        self.received = 0
+        self.start = time.perf_counter()
+        # Pedaços de ~20 ms de link, para o ritmo ficar uniforme
+        self.chunk = max(1024, int(self.rate / 50)) if self.rate else 65536
+
+    def _fill(self):
+        if self.rate:
+            ahead = self.received / self.rate - (time.perf_counter() - self.start)
+            if ahead > 0:
+                time.sleep(ahead)
+        data = self.sock.recv(self.chunk)
+        if not data:
+            raise ConnectionError("Conexão encerrada pelo servidor")
+        self.received += len(data)
+        self.buffer += data
+
+    def readline(self):
+        while True:
+            end = self.buffer.find(b'\r\n')
+            if end >= 0:
+                line = bytes(self.buffer[:end])
+                del self.buffer[:end + 2]
+                return line
+            self._fill()
+
+    def read(self, size):
+        while len(self.buffer) < size:
+            self._fill()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+class Viewer(threading.Thread):
+    """Espectador simulado: lê o multipart, separa os frames pelo Content-Length
+    e registra chegada, tamanho e latência (pelo X-Timestamp do servidor)"""
+
+    def __init__(self, number, host, port, path, kbps=0, read_delay=0, rcvbuf=DEFAULT_RCVBUF):
+        super().__init__(daemon=True)
+        self.number = number
+        self.host = host
+        self.port = port
+        self.path = path
+        self.kbps = kbps
+        self.read_delay = read_delay
+        self.rcvbuf = rcvbuf
+        self.stop = threading.Event()
+        self.arrivals = []
+        self.latencies = []
+        self.bytes = 0
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    def run(self):
+        sock = None
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if self.rcvbuf:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            sock.settimeout(10)
+            sock.connect((self.host, self.port))
+            sock.sendall(f"GET {self.path} HTTP/1.1\r\nHost: {self.host}\r\n\r\n".encode('latin-1'))
+            reader = PacedReader(sock, self.kbps)
+
+            status = reader.readline().decode('latin-1')
+            if ' 200 ' not in status + ' ':
+                raise ConnectionError(status or "Resposta vazia")
+            while reader.readline():
+                pass  # cabeçalhos HTTP
+            self.started = time.perf_counter()
+
+            while not self.stop.is_set():
+                self._read_frame(reader)
+        except Exception as e:
+            if not self.stop.is_set():
+                self.error = str(e)
+        finally:
+            self.finished = time.perf_counter()
+            if sock:
+                sock.close()
+
+    def _read_frame(self, reader):
+        line = reader.readline()
+        while not line.startswith(b'--'):
+            line = reader.readline()  # CRLF entre as partes
+        headers = {}
+        line = reader.readline()
+        while line:
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+            line = reader.readline()
+        length = int(headers['content-length'])
+        reader.read(length)
+
+        now = time.time()
+        self.arrivals.append(time.perf_counter())
+        self.bytes += length
+        if 'x-timestamp' in headers:
+            self.latencies.append((now - float(headers['x-timestamp'])) * 1000)
+        if self.read_delay:
+            # Simula o tempo de decodificação/desenho do aparelho
+            time.sleep(self.read_delay)
+
+    def report(self):
+        elapsed = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        intervals = [(b - a) * 1000 for a, b in zip(self.arrivals, self.arrivals[1:])]
+        return {
+            'client': self.number,
+            'link_kbps': self.kbps or None,
+            'frames': len(self.arrivals),
+            'fps': round(len(self.arrivals) / elapsed, 2) if elapsed > 0 else 0,
+            'latency_ms': {'p50': percentile(self.latencies, 0.5), 'p99': percentile(self.latencies, 0.99)},
+            'interval_ms': {'p50': percentile(intervals, 0.5), 'p99': percentile(intervals, 0.99)},
+            'throughput_kbps': round(self.bytes * 8 / 1000 / elapsed, 1) if elapsed > 0 else 0,
+            'error': self.error
+        }
+
+class ResourceSampler(threading.Thread):
+    """Amostra CPU e RSS do processo do servidor (e filhos) pelo /proc"""
+
+    def __init__(self, pid, interval=1.0):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.stop = threading.Event()
+        self.samples = []
+        self.ticks = os.sysconf('SC_CLK_TCK')
+
+    def _processes(self):
+        # O reloader do Flask roda o servidor em um processo filho
+        pids = {self.pid}
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as f:
+                        fields = f.read().rsplit(')', 1)[1].split()
+                    if int(fields[1]) in pids:
+                        pids.add(int(entry))
+                except (OSError, IndexError, ValueError):
+                    pass
+        return pids
+
+    def _usage(self):
+        cpu = 0
+        rss = 0
+        for pid in self._processes():
+            try:
+                with open(f'/proc/{pid}/stat') as f:
+                    fields = f.read().rsplit(')', 1)[1].split()
+                cpu += (int(fields[11]) + int(fields[12])) / self.ticks
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            rss += int(line.split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+        return cpu, rss
+
+    def run(self):
+        start = time.perf_counter()
+        last_cpu, _ = self._usage()
+        last = start
+        while not self.stop.wait(self.interval):
+            cpu, rss = self._usage()
+            now = time.perf_counter()
+            self.samples.append({
+                't': round(now - start, 1),
+                'cpu_percent': round((cpu - last_cpu) / (now - last) * 100, 1),
+                'rss_mb': round(rss / 1024, 1)
+            })
+            last_cpu, last = cpu, now
+
+    def report(self):
+        cpu = [sample['cpu_percent'] for sample in self.samples]
+        rss = [sample['rss_mb'] for sample in self.samples]
+        return {
+            'cpu_percent': {'avg': round(sum(cpu) / len(cpu), 1) if cpu else None, 'max': max(cpu, default=None)},
+            'rss_mb': {'start': rss[0] if rss else None, 'max': max(rss, default=None)},
+            'samples': self.samples
+        }
+
+def start_server(args):
+    """Inicia o screen_server com fonte sintética e espera a porta responder"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'screen_server.py')
+    command = [sys.executable, script, '--server', args.server, '--source', args.source,
+               '--resolution', args.resolution, '--host', '127.0.0.1', '--port', str(args.port),
+               '--fps', str(args.fps), '--max-clients', str(max(args.clients, 1) + 5)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                               stderr=None if args.verbose else subprocess.DEVNULL)
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Servidor encerrou com código {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', args.port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Servidor não respondeu a tempo")
+
+def stop_server(process, base_url):
+    try:
+        urlopen(base_url + '/shutdown', timeout=3).read()
+        process.wait(5)
+    except Exception:
+        process.terminate()
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def parse_links(text):
+    return [int(value) for value in text.split(',') if value] or [0]
+
+def summarize(clients):
+    fps = [client['fps'] for client in clients if client['frames']]
+    latencies = [client['latency_ms']['p50'] for client in clients if client['latency_ms']['p50'] is not None]
+    return {
+        'clients': len(clients),
+        'failed': sum(1 for client in clients if client['error'] and not client['frames']),
+        'fps': {'avg': round(sum(fps) / len(fps), 2) if fps else 0, 'min': min(fps, default=0)},
+        'latency_p50_ms': percentile(latencies, 0.5),
+        'latency_p99_ms': max((client['latency_ms']['p99'] or 0 for client in clients), default=None),
+        'throughput_kbps': round(sum(client['throughput_kbps'] for client in clients), 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga com espectadores simulados do /video_feed")
+    parser.add_argument('--clients', type=int, default=10, help="Número de espectadores simultâneos")
+    parser.add_argument('--duration', type=float, default=20, help="Duração da medição em segundos")
+    parser.add_argument('--ramp', type=float, default=0.1, help="Intervalo entre a entrada de cada cliente (s)")
+    parser.add_argument('--link', default='0',
+                        help="Velocidades de link em kbit/s, distribuídas entre os clientes (0 = sem limite)")
+    parser.add_argument('--read-delay', type=float, default=0,
+                        help="Pausa após cada frame em ms (decodificação lenta no aparelho)")
+    parser.add_argument('--rcvbuf', type=int, default=DEFAULT_RCVBUF, help="SO_RCVBUF dos clientes (0 = padrão)")
+    parser.add_argument('--query', default='', help="Parâmetros do /video_feed, ex.: fps=30&adaptive=0")
+    parser.add_argument('--url', help="Servidor já em execução (padrão: inicia um com fonte sintética)")
+    parser.add_argument('--server-pid', type=int, help="PID do servidor externo, para medir CPU e RSS")
+    parser.add_argument('--server', choices=['async', 'flask'], default='async', help="Modo do servidor iniciado")
+    parser.add_argument('--source', default='motion', help="Fonte sintética do servidor iniciado")
+    parser.add_argument('--resolution', default='1920x1080', help="Resolução da fonte sintética")
+    parser.add_argument('--fps', type=int, default=30, help="FPS alvo do servidor iniciado")
+    parser.add_argument('--port', type=int, default=5055, help="Porta do servidor iniciado")
+    parser.add_argument('--sample-interval', type=float, default=1.0, help="Intervalo das amostras de CPU/RSS")
+    parser.add_argument('--output', help="Arquivo JSON de saída")
+    parser.add_argument('--verbose', action='store_true', help="Mostra o log do servidor iniciado")
+    args = parser.parse_args()
+    parse_resolution(args.resolution)
+
+    process = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+        server_pid = args.server_pid
+    else:
+        process = start_server(args)
+        base_url = f"http://127.0.0.1:{args.port}"
+        server_pid = process.pid
+
+    target = urlsplit(base_url)
+    path = '/video_feed' + (f"?{args.query}" if args.query else '')
+    links = parse_links(args.link)
+    sampler = ResourceSampler(server_pid, args.sample_interval) if server_pid else None
+    viewers = [Viewer(number, target.hostname, target.port or 80, path, links[number % len(links)],
+                      args.read_delay / 1000, args.rcvbuf)
+               for number in range(args.clients)]
+
+    try:
+        if sampler:
+            sampler.start()
+        for viewer in viewers:
+            viewer.start()
+            time.sleep(args.ramp)
+        print(f"{args.clients} clientes conectados, medindo por {args.duration:.0f}s...", file=sys.stderr)
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for viewer in viewers:
+            viewer.stop.set()
+        if sampler:
+            sampler.stop.set()
+        for viewer in viewers:
+            viewer.join(12)
+        if process:
+            stop_server(process, base_url)
+
+    clients = [viewer.report() for viewer in viewers]
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': git_commit(),
+        'url': base_url + path,
+        'server': None if args.url else {'mode': args.server, 'source': args.source,
+                                         'resolution': args.resolution, 'fps': args.fps},
+        'links_kbps': links,
+        'read_delay_ms': args.read_delay,
+        'summary': summarize(clients),
+        'resources': sampler.report() if sampler else None,
+        'clients': clients
+    }
+
+    summary = report['summary']
+    print(f"clientes: {summary['clients']} (falhas: {summary['failed']})", file=sys.stderr)
+    print(f"FPS médio: {summary['fps']['avg']} (mínimo {summary['fps']['min']})", file=sys.stderr)
+    print(f"latência p50: {summary['latency_p50_ms']} ms, p99: {summary['latency_p99_ms']} ms", file=sys.stderr)
+    print(f"vazão total: {summary['throughput_kbps']} kbit/s", file=sys.stderr)
+    if sampler:
+        resources = report['resources']
+        print(f"CPU do servidor: média {resources['cpu_percent']['avg']}%, máximo {resources['cpu_percent']['max']}%; "
+              f"RSS máximo {resources['rss_mb']['max']} MB", file=sys.stderr)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"Resultados salvos em {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
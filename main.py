@@ -8,6 +8,9 @@ from datetime import datetime
 from pathlib import Path
 from PIL import Image
 
+from adb_utils import ADBUtils
+from device_registry import REMOVED, CHANGED
+
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QComboBox, QSpinBox, QLineEdit,
@@ -88,6 +91,10 @@ class LogWidget(QTextEdit):
         self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
 
 class AndroidScreenRecorder(QMainWindow):
+    # Eventos do registro de dispositivos chegam na thread dele; o sinal os
+    # entrega na thread da interface
+    device_event = Signal(object)
+    
     def __init__(self):
         super().__init__()
         self.setWindowTitle(f"{APP_NAME} v{APP_VERSION}")
@@ -216,6 +223,13 @@ class AndroidScreenRecorder(QMainWindow):
         
         # Verificar ADB na inicialização
         self.check_adb_connection()
+        
+        # Lista de dispositivos atualizada pelo servidor ADB (sem polling)
+        self.device_event.connect(self.on_device_event)
+        self.device_registry = self.adb.start_tracking()
+        # Com replay, aparelhos que chegaram entre o refresh_devices() e a inscrição
+        # também entram na lista; os que já estão nela são ignorados
+        self.device_registry.subscribe(self.device_event.emit, replay=True)
     
     def setup_adb_path(self):
         """Configura o caminho para o ADB local"""
@@ -236,6 +250,9 @@ class AndroidScreenRecorder(QMainWindow):
             self.using_local_adb = False
         else:
             self.using_local_adb = True
+        
+        # Comandos vão direto ao servidor ADB; o binário só é usado como alternativa
+        self.adb = ADBUtils(self.adb_path)
     
     def setup_ui(self):
         # Widget central
@@ -611,33 +628,21 @@ class AndroidScreenRecorder(QMainWindow):
 
         # Verificar se o ADB está funcionando
         try:
-            adb_version = subprocess.run(
-                [self.adb_path, "version"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
+            adb_version = self.adb.version()
+            adb_version.check_returncode()
             self.mirror_log.log_message(f"ADB versão: {adb_version.stdout.strip()}", "info")
             
             # Verificar status do dispositivo
-            adb_devices = subprocess.run(
-                [self.adb_path, "devices"], 
-                capture_output=True,
-                text=True,
-                check=True
-            )
+            adb_devices = self.adb.devices()
+            adb_devices.check_returncode()
             self.mirror_log.log_message(f"Dispositivos ADB: {adb_devices.stdout.strip()}", "info")
             
             if self.connected_device not in adb_devices.stdout:
                 raise Exception("Dispositivo não encontrado ou não autorizado")
             
             # Verificar se o dispositivo está respondendo
-            state = subprocess.run(
-                [self.adb_path, "-s", self.connected_device, "get-state"],
-                capture_output=True,
-                text=True,
-                check=True
-            )
+            state = self.adb.get_state(self.connected_device)
+            state.check_returncode()
             self.mirror_log.log_message(f"Estado do dispositivo: {state.stdout.strip()}", "info")
             
         except Exception as e:
@@ -663,19 +668,12 @@ class AndroidScreenRecorder(QMainWindow):
         try:
             # Primeiro, vamos tentar enviar o servidor para o dispositivo
             self.mirror_log.log_message("Enviando servidor scrcpy para o dispositivo...", "info")
-            push_result = subprocess.run(
-                [self.adb_path, "-s", self.connected_device, "push", scrcpy_server, "/data/local/tmp/scrcpy-server"],
-                capture_output=True,
-                text=True
-            )
+            push_result = self.adb.push(self.connected_device, scrcpy_server, "/data/local/tmp/scrcpy-server")
             if push_result.returncode != 0:
                 raise Exception(f"Erro ao enviar servidor: {push_result.stderr}")
             
             # Dar permissão de execução ao servidor
-            subprocess.run(
-                [self.adb_path, "-s", self.connected_device, "shell", "chmod 777 /data/local/tmp/scrcpy-server"],
-                check=True
-            )
+            self.adb.shell(self.connected_device, "chmod 777 /data/local/tmp/scrcpy-server").check_returncode()
 
             # Configuração básica do scrcpy
             cmd = [
@@ -786,8 +784,7 @@ class AndroidScreenRecorder(QMainWindow):
     
     def check_adb_connection(self):
         try:
-            result = subprocess.run([self.adb_path, "version"], 
-                                  capture_output=True, text=True)
+            result = self.adb.version()
             if result.returncode == 0:
                 self.log_widget.log_message("ADB conectado com sucesso!", "success")
                 self.refresh_devices()
@@ -798,26 +795,36 @@ class AndroidScreenRecorder(QMainWindow):
     
     def refresh_devices(self):
         try:
-            result = subprocess.run([self.adb_path, "devices"], 
-                                  capture_output=True, text=True)
-            
-            devices = []
-            for line in result.stdout.split('\n')[1:]:
-                if '\t' in line:
-                    device = line.split('\t')[0]
-                    devices.append(device)
+            devices = [serial for serial, state in self.adb.list_devices()]
             
             self.device_combo.clear()
-            if devices:
-                self.device_combo.addItems(devices)
-                self.status_text.setText("✅ Dispositivo(s) encontrado(s)")
-                self.status_text.setStyleSheet("color: #059862;")
-            else:
-                self.status_text.setText("❌ Nenhum dispositivo")
-                self.status_text.setStyleSheet("color: #C73E1D;")
+            self.device_combo.addItems(devices)
+            self.update_device_status()
             
         except Exception as e:
             self.log_widget.log_message(f"Erro ao atualizar dispositivos: {str(e)}", "error")
+    
+    def update_device_status(self):
+        if self.device_combo.count():
+            self.status_text.setText("✅ Dispositivo(s) encontrado(s)")
+            self.status_text.setStyleSheet("color: #059862;")
+        else:
+            self.status_text.setText("❌ Nenhum dispositivo")
+            self.status_text.setStyleSheet("color: #C73E1D;")
+    
+    @Slot(object)
+    def on_device_event(self, event):
+        index = self.device_combo.findText(event.serial)
+        if event.kind == REMOVED:
+            if index >= 0:
+                self.device_combo.removeItem(index)
+            self.log_widget.log_message(f"Dispositivo desconectado: {event.serial}", "warning")
+        elif event.kind == CHANGED and index >= 0:
+            self.log_widget.log_message(f"Dispositivo {event.serial}: {event.previous} → {event.state}", "info")
+        elif index < 0:
+            self.device_combo.addItem(event.serial)
+            self.log_widget.log_message(f"Dispositivo conectado: {event.serial} ({event.state})", "success")
+        self.update_device_status()
 
     def on_device_selected(self, index):
         if index >= 0:
@@ -855,7 +862,6 @@ class AndroidScreenRecorder(QMainWindow):
             max_time = int(self.max_time_spin.value()) * 60  # Converter para segundos
             
             # Preparar comando
-            cmd = [self.adb_path, "-s", self.connected_device, "shell"]
             record_cmd = ["screenrecord"]
             
             if resolution != "Auto":
@@ -868,13 +874,8 @@ class AndroidScreenRecorder(QMainWindow):
                 "/sdcard/screen.mp4"
             ])
             
-            # Iniciar gravação
-            self.recording_process = subprocess.Popen(
-                cmd + record_cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
+            # Iniciar gravação (a conexão fica aberta enquanto o screenrecord roda)
+            self.recording_process = self.adb.start_shell(self.connected_device, *record_cmd)
             
             # Atualizar interface
             self.is_recording = True
@@ -908,7 +909,7 @@ class AndroidScreenRecorder(QMainWindow):
                 self.recording_process.terminate()
             
             # Enviar Ctrl+C para o processo adb
-            subprocess.run([self.adb_path, "-s", self.connected_device, "shell", "killall", "screenrecord"])
+            self.adb.shell(self.connected_device, "killall", "screenrecord")
             
             # Aguardar um pouco
             time.sleep(1)
@@ -938,16 +939,10 @@ class AndroidScreenRecorder(QMainWindow):
             output_path = os.path.join(self.output_folder, filename)
             
             # Download do arquivo
-            subprocess.run([
-                self.adb_path, "-s", self.connected_device,
-                "pull", "/sdcard/screen.mp4", output_path
-            ])
+            self.adb.pull(self.connected_device, "/sdcard/screen.mp4", output_path).check_returncode()
             
             # Remover arquivo do dispositivo
-            subprocess.run([
-                self.adb_path, "-s", self.connected_device,
-                "shell", "rm", "/sdcard/screen.mp4"
-            ])
+            self.adb.shell(self.connected_device, "rm", "/sdcard/screen.mp4")
             
             self.log_widget.log_message(f"Arquivo salvo em: {output_path}", "success")
             
@@ -974,22 +969,13 @@ class AndroidScreenRecorder(QMainWindow):
             output_path = os.path.join(self.output_folder, filename)
             
             # Capturar screenshot
-            subprocess.run([
-                self.adb_path, "-s", self.connected_device,
-                "shell", "screencap", "-p", "/sdcard/screen.png"
-            ])
+            self.adb.shell(self.connected_device, "screencap", "-p", "/sdcard/screen.png").check_returncode()
             
             # Download do arquivo
-            subprocess.run([
-                self.adb_path, "-s", self.connected_device,
-                "pull", "/sdcard/screen.png", output_path
-            ])
+            self.adb.pull(self.connected_device, "/sdcard/screen.png", output_path).check_returncode()
             
             # Remover arquivo do dispositivo
-            subprocess.run([
-                self.adb_path, "-s", self.connected_device,
-                "shell", "rm", "/sdcard/screen.png"
-            ])
+            self.adb.shell(self.connected_device, "rm", "/sdcard/screen.png")
             
             self.log_widget.log_message(f"Screenshot salvo em: {output_path}", "success")
             
@@ -1035,9 +1021,12 @@ class AndroidScreenRecorder(QMainWindow):
     
     def save_settings(self):
         try:
-            settings = {
-                "output_folder": self.output_folder
-            }
+            # Preserva as demais chaves (ex.: regiões do servidor de segunda tela)
+            settings = {}
+            if os.path.exists("settings.json"):
+                with open("settings.json", "r") as f:
+                    settings = json.load(f)
+            settings["output_folder"] = self.output_folder
             
             with open("settings.json", "w") as f:
                 json.dump(settings, f, indent=4)
@@ -1052,6 +1041,10 @@ class AndroidScreenRecorder(QMainWindow):
         if self.is_mirroring:
             self.stop_mirroring()
         
+        # Fechar as conexões com o servidor ADB
+        self.device_registry.stop()
+        self.adb.client.close()
+        
         # Salvar configurações
         self.save_settings()
         event.accept()
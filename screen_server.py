@@ -1,14 +1,30 @@
-from flask import Flask, Response, request
+from flask import Flask, Response, request, jsonify
 import mss
 import mss.tools
 import io
-from PIL import Image
+from PIL import Image, ImageChops, ImageDraw
 import socket
 import logging
 import os
 import signal
 import threading
 import sys
+import synthetic_screen
+import time
+import argparse
+import asyncio
+from urllib.parse import urlsplit, parse_qs
+import struct
+import queue
+import math
+import weakref
+import itertools
+import collections
+import bisect
+import json
+import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -22,6 +38,73 @@ should_stop = False
 sct = None
 stream_thread = None
 
+# Fonte de captura: 'mss' (tela real) ou uma fonte sintética (ver synthetic_screen.py)
+CAPTURE_SOURCE = 'mss'
+SYNTHETIC_RESOLUTION = (1920, 1080)
+
+# Regiões nomeadas para o /video_feed?region=<nome>, lidas do settings.json:
+# {"regions": {"editor": {"left": 0, "top": 0, "width": 1280, "height": 720}}}
+SETTINGS_FILE = 'settings.json'
+
+# Controle de taxa de quadros
+TARGET_FPS = 30  # FPS alvo do servidor (pode ser alterado com --fps ou /fps/<n>)
+MIN_FPS = 1
+MAX_FPS = 60
+FPS_REPORT_INTERVAL = 5.0  # segundos entre relatórios de FPS no log
+KEEPALIVE_INTERVAL = 2.0  # reenvia o último frame se a tela ficar parada por este tempo
+# Produtores de regiões (crop=/region=) sem clientes por este tempo são encerrados
+# e removidos, para que recortes diferentes não deixem threads e capturas paradas
+REGION_HUB_LINGER = 10.0
+
+# Entrega aos clientes
+STREAM_SNDBUF = 128 * 1024  # buffer de envio do kernel por cliente: limita frames em trânsito
+
+# Servidor asyncio (--server async)
+MAX_CLIENTS = 50  # limite de espectadores simultâneos do /video_feed
+SEND_TIMEOUT = 30.0  # desconecta clientes que não consomem nada por este tempo
+
+# WebSocket (/ws): frames binários confirmados pela página depois de desenhados
+WS_WINDOW = 2  # frames enviados e ainda não confirmados, no máximo
+WS_MAX_MESSAGE = 64 * 1024  # tamanho máximo das mensagens do cliente (acks e viewport)
+WEBSOCKET_PORT = None  # porta do WebSocket quando difere da página (servidor auxiliar no modo Flask)
+
+# /snapshot.jpg
+SNAPSHOT_LINGER = 10.0  # mantém a captura ativa por este tempo após o último pedido
+SNAPSHOT_FIRST_WAIT = 5.0  # espera pelo primeiro frame quando a captura estava parada
+SNAPSHOT_MAX_WAIT = 30.0  # espera máxima do long-poll (wait=<segundos>)
+SNAPSHOT_WORKERS = 32  # long-polls simultâneos no servidor asyncio
+# Identifica esta execução do servidor nos ETags, que usam a sequência dos frames
+SERVER_ID = os.urandom(4).hex()
+
+# Métricas
+METRICS_WINDOW = 512  # amostras mantidas por histograma
+MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+BYTES_BUCKETS = (10_000, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000)
+
+# Codificação
+JPEG_QUALITY = 70
+JPEG_ENCODER = 'auto'  # auto (teste de velocidade na inicialização), pillow, simplejpeg ou turbojpeg
+JPEG_SUBSAMPLING = '4:2:0'  # 4:4:4 preserva texto colorido; 4:2:0 é o mais rápido e compacto
+JPEG_OPTIMIZE = False  # tabelas Huffman otimizadas: arquivos menores, codificação mais lenta
+JPEG_PROGRESSIVE = False
+# Controle adaptativo por cliente: degraus de qualidade e escala, do melhor para o pior
+QUALITY_STEPS = (85, 70, 55, 40, 30)
+SCALE_STEPS = (1.0, 0.75, 0.5, 0.35)
+ADAPTIVE_MIN_FPS = 5
+# Simulcast: camadas fixas (nome, qualidade, escala), da melhor para a pior. Cada
+# frame é codificado uma vez por camada em uso e os clientes trocam de camada
+# conforme o link, então o custo cresce com as camadas e não com os espectadores
+SIMULCAST = True
+TIERS = (('high', 80, 1.0), ('medium', 65, 0.75), ('low', 50, 0.5))
+VIEWPORT_STEP = 64  # largura alvo arredondada em degraus para clientes parecidos compartilharem a codificação
+# Threads de codificação: o Pillow libera o GIL durante a codificação JPEG
+ENCODE_WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+TILE_SIZE = 128  # tamanho dos blocos no modo de streaming por blocos (/tiles)
+# Modo por faixas (/tiles?layout=strips): cada frame é dividido em faixas horizontais
+# codificadas em paralelo, então a latência de codificação cai para ~1/núcleos
+STRIP_WORKERS = max(1, min(8, os.cpu_count() or 1))
+STRIP_ALIGN = 16  # altura das faixas múltipla do bloco MCU do JPEG (16 px em 4:2:0)
+
 def get_local_ip():
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -32,66 +115,1561 @@ def get_local_ip():
     except:
         return "IP não encontrado"
 
-def init_screen_capture():
+class RollingHistogram:
+    """Últimas METRICS_WINDOW amostras de uma medida, para os percentis, mais
+    contadores acumulados desde o início (total, soma e buckets), que só crescem
+    como o Prometheus espera. Ordenar a janela acontece apenas quando /metrics é lido."""
+    
+    def __init__(self, buckets=MS_BUCKETS, size=METRICS_WINDOW):
+        self.buckets = buckets
+        self.samples = collections.deque(maxlen=size)
+        self.total_count = 0
+        self.total_sum = 0.0
+        self.bucket_counts = [0] * len(buckets)  # observações por bucket (não cumulativo)
+        self.lock = threading.Lock()
+    
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.samples.append(value)
+            self.total_count += 1
+            self.total_sum += value
+            if index < len(self.bucket_counts):
+                self.bucket_counts[index] += 1
+    
+    def totals(self):
+        """Contadores acumulados: {'count', 'sum', 'buckets': {le: observações <= le}}"""
+        with self.lock:
+            count, total, counts = self.total_count, self.total_sum, list(self.bucket_counts)
+        buckets = {}
+        cumulative = 0
+        for le, observed in zip(self.buckets, counts):
+            cumulative += observed
+            buckets[str(le)] = cumulative
+        return {'count': count, 'sum': round(total, 3), 'buckets': buckets}
+    
+    def snapshot(self):
+        with self.lock:
+            values = sorted(self.samples)
+        count = len(values)
+        if not count:
+            return {'count': 0}
+        
+        def quantile(q):
+            return round(values[min(count - 1, int(q * count))], 3)
+        
+        return {
+            'count': count,
+            'sum': round(sum(values), 3),
+            'mean': round(sum(values) / count, 3),
+            'p50': quantile(0.5),
+            'p90': quantile(0.9),
+            'p99': quantile(0.99),
+            'max': round(values[-1], 3),
+            'buckets': {str(le): sum(1 for v in values if v <= le) for le in self.buckets}
+        }
+
+class Metrics:
+    """Registro de histogramas por nome e rótulos"""
+    
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+    
+    def histogram(self, name, buckets=MS_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        hist = self.histograms.get(key)
+        if hist is None:
+            with self.lock:
+                hist = self.histograms.setdefault(key, RollingHistogram(buckets))
+        return hist
+    
+    def observe(self, name, value, buckets=MS_BUCKETS, **labels):
+        self.histogram(name, buckets, **labels).observe(value)
+
+metrics = Metrics()
+
+def create_screen_capture(monitor_index):
+    """Cria a fonte de captura: uma instância do mss (que deve ser usada apenas
+    na thread que a criou) ou uma tela sintética"""
     try:
-        global sct
-        sct = mss.mss()
-        logger.info(f"Monitores disponíveis: {len(sct.monitors)}")
+        if CAPTURE_SOURCE == 'mss':
+            capture = mss.mss()
+        else:
+            capture = synthetic_screen.SyntheticScreen(CAPTURE_SOURCE, *SYNTHETIC_RESOLUTION)
+        logger.info(f"Monitores disponíveis: {len(capture.monitors)}")
         
         # Ajusta o monitor secundário para ter dimensões próprias
-        if MONITOR_INDEX == 1 and len(sct.monitors) == 1:
+        if monitor_index == 1 and len(capture.monitors) == 1:
             # Cria um monitor virtual secundário
-            sct.monitors.append({
+            capture.monitors.append({
                 'top': 0,
-                'left': sct.monitors[0]['width'],  # Posiciona à direita do monitor principal
+                'left': capture.monitors[0]['width'],  # Posiciona à direita do monitor principal
                 'width': 1920,
                 'height': 1080,
                 'name': 'Monitor 2'
             })
         
-        for i, monitor in enumerate(sct.monitors):
+        for i, monitor in enumerate(capture.monitors):
             logger.info(f"Monitor {i}: {monitor}")
-        return True
+        return capture
     except Exception as e:
         logger.error(f"Erro ao inicializar captura de tela: {e}")
-        return False
+        return None
+
+def init_screen_capture():
+    global sct
+    sct = create_screen_capture(MONITOR_INDEX)
+    return sct is not None
+
+class ChangeDetector:
+    """Detecta se o buffer BGRA bruto mudou desde o último frame capturado.
+    A comparação de bytes é feita por memcmp, sem converter nem codificar."""
+    
+    def __init__(self):
+        self.previous = None
+    
+    def changed(self, raw):
+        if self.previous is not None and raw == self.previous:
+            return False
+        # O mss cria um buffer novo a cada captura, então basta guardar a referência
+        self.previous = raw
+        return True
+
+def valid_monitor(index):
+    """Monitores que podem ser transmitidos: os do mss e o secundário virtual"""
+    count = len(sct.monitors) if sct else 1
+    return 0 <= index < max(2, count)
+
+black_frame_cache = None
+black_frame_lock = threading.Lock()
+
+def black_frame():
+    """Frame preto do monitor secundário ausente. É criado uma única vez e
+    compartilhado, então cada variante JPEG também é codificada uma única vez."""
+    global black_frame_cache
+    if black_frame_cache is None:
+        with black_frame_lock:
+            if black_frame_cache is None:
+                black_frame_cache = Frame(Image.new('RGB', (1920, 1080), color='black'))
+    return black_frame_cache
+
+def crop_monitor(monitor, region):
+    """Retângulo do mss para uma região (left, top, width, height) relativa ao
+    monitor, limitado às bordas dele"""
+    left, top, width, height = region
+    left = min(max(0, left), monitor['width'] - 1)
+    top = min(max(0, top), monitor['height'] - 1)
+    return {
+        'left': monitor['left'] + left,
+        'top': monitor['top'] + top,
+        'width': max(1, min(width, monitor['width'] - left)),
+        'height': max(1, min(height, monitor['height'] - top))
+    }
+
+def grab_screen(capture, monitor_index, detector=None, region=None):
+    """Captura o buffer bruto do monitor (ou só da região pedida). Retorna None
+    quando o detector informa que a tela não mudou."""
+    # Se for monitor secundário e não existir, retorna o frame preto em cache
+    if monitor_index == 1 and len(capture.monitors) == 1:
+        if detector and not detector.changed(b''):
+            return None
+        return black_frame()
+    
+    monitor = capture.monitors[monitor_index]
+    if region:
+        # O mss copia apenas os pixels da região: captura, conversão e
+        # codificação ficam proporcionais à área recortada
+        monitor = crop_monitor(monitor, region)
+    start = time.perf_counter()
+    screen = capture.grab(monitor)
+    metrics.observe('capture_ms', (time.perf_counter() - start) * 1000, monitor=monitor_index)
+    if detector and not detector.changed(screen.raw):
+        return None
+    return screen
+
+class ImagePool:
+    """Imagens RGB já alocadas, reaproveitadas para receber os pixels das capturas"""
+    
+    def __init__(self, limit=8):
+        self.limit = limit
+        self.free = {}
+        self.lock = threading.Lock()
+    
+    def acquire(self, size):
+        with self.lock:
+            images = self.free.get(size)
+            if images:
+                return images.pop()
+        return Image.new('RGB', size)
+    
+    def release(self, img):
+        with self.lock:
+            images = self.free.setdefault(img.size, [])
+            if len(images) < self.limit:
+                images.append(img)
+
+image_pool = ImagePool()
+
+def screen_to_image(screen, pool=None):
+    """Converte uma captura do mss em imagem RGB lendo direto o buffer BGRA
+    (screen.rgb faria uma conversão intermediária e mais uma cópia)"""
+    if isinstance(screen, Frame):
+        return screen.image
+    if isinstance(screen, Image.Image):
+        return screen
+    start = time.perf_counter()
+    if pool:
+        # Decodifica na memória de uma imagem reaproveitada, sem alocar
+        img = pool.acquire(screen.size)
+        img.frombytes(screen.raw, 'raw', 'BGRX')
+    else:
+        img = Image.frombuffer("RGB", screen.size, screen.raw, 'raw', 'BGRX', 0, 1)
+    metrics.observe('convert_ms', (time.perf_counter() - start) * 1000)
+    return img
+
+def grab_image(capture, monitor_index, detector=None, region=None):
+    """Captura o monitor como imagem RGB (None se a tela não mudou)"""
+    screen = grab_screen(capture, monitor_index, detector, region)
+    if screen is None:
+        return None
+    return screen_to_image(screen)
 
-def capture_screen():
+SUBSAMPLINGS = ('4:4:4', '4:2:2', '4:2:0')
+
+class JpegEncoder:
+    """Interface dos codificadores JPEG. Cada implementação recebe uma imagem
+    RGB do Pillow e retorna os bytes do JPEG."""
+    
+    name = None
+    # Flags que a implementação consegue respeitar
+    supports_optimize = False
+    supports_progressive = False
+    
+    def __init__(self, subsampling=JPEG_SUBSAMPLING, optimize=False, progressive=False):
+        if subsampling not in SUBSAMPLINGS:
+            raise ValueError(f"Subamostragem inválida: {subsampling}")
+        if optimize and not self.supports_optimize:
+            raise ValueError(f"{self.name} não suporta optimize")
+        if progressive and not self.supports_progressive:
+            raise ValueError(f"{self.name} não suporta progressive")
+        self.subsampling = subsampling
+        self.optimize = optimize
+        self.progressive = progressive
+    
+    def encode(self, img, quality):
+        raise NotImplementedError
+
+class PillowEncoder(JpegEncoder):
+    """Codificador do Pillow, sempre disponível"""
+    
+    name = 'pillow'
+    supports_optimize = True
+    supports_progressive = True
+    
+    def encode(self, img, quality):
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality, subsampling=self.subsampling,
+                 optimize=self.optimize, progressive=self.progressive)
+        # No CPython o getvalue() entrega o buffer interno do BytesIO sem copiar
+        return buffer.getvalue()
+
+class SimpleJpegEncoder(JpegEncoder):
+    """libjpeg-turbo pelo pacote simplejpeg (opcional)"""
+    
+    name = 'simplejpeg'
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        import numpy
+        import simplejpeg
+        self.numpy = numpy
+        self.simplejpeg = simplejpeg
+        self.colorsubsampling = self.subsampling.replace(':', '')
+    
+    def encode(self, img, quality):
+        return self.simplejpeg.encode_jpeg(self.numpy.asarray(img), quality, colorspace='RGB',
+                                           colorsubsampling=self.colorsubsampling, fastdct=True)
+
+class TurboJpegEncoder(JpegEncoder):
+    """libjpeg-turbo pelo pacote PyTurboJPEG (opcional, precisa da biblioteca instalada)"""
+    
+    name = 'turbojpeg'
+    supports_progressive = True
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        import numpy
+        import turbojpeg
+        self.numpy = numpy
+        self.turbo = turbojpeg.TurboJPEG()
+        self.pixel_format = turbojpeg.TJPF_RGB
+        self.jpeg_subsample = {'4:4:4': turbojpeg.TJSAMP_444, '4:2:2': turbojpeg.TJSAMP_422,
+                               '4:2:0': turbojpeg.TJSAMP_420}[self.subsampling]
+        self.flags = turbojpeg.TJFLAG_FASTDCT
+        if self.progressive:
+            self.flags |= turbojpeg.TJFLAG_PROGRESSIVE
+    
+    def encode(self, img, quality):
+        return self.turbo.encode(self.numpy.asarray(img), quality, self.pixel_format,
+                                 self.jpeg_subsample, self.flags)
+
+ENCODER_BACKENDS = {encoder.name: encoder for encoder in (PillowEncoder, SimpleJpegEncoder, TurboJpegEncoder)}
+
+# Codificador em uso; select_encoder() troca pelo mais rápido na inicialização
+jpeg_encoder = PillowEncoder()
+
+def self_test_image(size=(1280, 720)):
+    """Imagem de teste com texto e ruído, parecida com uma tela real"""
+    img = Image.merge('RGB', (Image.linear_gradient('L').resize(size), Image.effect_noise(size, 32),
+                              Image.effect_mandelbrot(size, (-2.2, -1.4, 1.0, 1.4), 32)))
+    ImageDraw.Draw(img).text((20, 20), "Segunda Tela 0123456789", fill='white')
+    return img
+
+def select_encoder(name=JPEG_ENCODER, subsampling=JPEG_SUBSAMPLING, optimize=JPEG_OPTIMIZE,
+                   progressive=JPEG_PROGRESSIVE, rounds=5):
+    """Instancia os codificadores disponíveis, confere que geram um JPEG válido
+    e escolhe o mais rápido (ou o pedido pelo nome). O Pillow é o reserva."""
+    global jpeg_encoder
+    names = list(ENCODER_BACKENDS) if name == 'auto' else [name]
+    img = self_test_image()
+    results = {}
+    for backend in names:
+        try:
+            encoder = ENCODER_BACKENDS[backend](subsampling, optimize, progressive)
+            data = encoder.encode(img, JPEG_QUALITY)
+            if Image.open(io.BytesIO(data)).size != img.size:
+                raise ValueError("JPEG gerado com tamanho errado")
+            times = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                encoder.encode(img, JPEG_QUALITY)
+                times.append(time.perf_counter() - start)
+            results[backend] = (sorted(times)[len(times) // 2], encoder)
+            logger.info(f"Codificador {backend}: {results[backend][0] * 1000:.1f} ms, {len(data)} bytes")
+        except Exception as e:
+            logger.info(f"Codificador {backend} indisponível: {str(e).splitlines()[0] if str(e) else e!r}")
+    
+    if results:
+        jpeg_encoder = min(results.values(), key=lambda result: result[0])[1]
+    else:
+        jpeg_encoder = PillowEncoder(subsampling, optimize, progressive)
+    logger.info(f"Codificador JPEG em uso: {jpeg_encoder.name} (subamostragem {jpeg_encoder.subsampling})")
+    return jpeg_encoder
+
+def encode_jpeg(img, quality=JPEG_QUALITY):
+    start = time.perf_counter()
+    data = jpeg_encoder.encode(img, quality)
+    metrics.observe('encode_ms', (time.perf_counter() - start) * 1000)
+    metrics.observe('frame_bytes', len(data), BYTES_BUCKETS)
+    return data
+
+def scaled_size(size, scale):
+    """Tamanho reduzido pela escala, com dimensões pares"""
+    if scale >= 1.0:
+        return size
+    return (max(2, int(size[0] * scale) & ~1), max(2, int(size[1] * scale) & ~1))
+
+def fit_size(size, width, height, dpr=1.0):
+    """Maior tamanho com a proporção do monitor que cabe na viewport do cliente
+    (em pixels físicos), sem nunca ampliar"""
+    if not width or not height:
+        return size
+    scale = min(width * dpr / size[0], height * dpr / size[1], 1.0)
+    if scale >= 1.0:
+        return size
+    
+    # Um fator inteiro de redução (ver fast_resize) é muito mais barato; vale a
+    # pena se o resultado não passar de 25% acima do necessário
+    factor = int(1 / scale)
+    if factor >= 2 and -(-size[0] // factor) <= size[0] * scale * 1.25:
+        return (-(-size[0] // factor), -(-size[1] // factor))
+    
+    target_width = min(size[0], math.ceil(size[0] * scale / VIEWPORT_STEP) * VIEWPORT_STEP)
+    return scaled_size(size, target_width / size[0])
+
+def tier_index(name, default=0):
+    """Índice da camada pelo nome (high, medium, low)"""
+    for index, tier in enumerate(TIERS):
+        if tier[0] == name:
+            return index
+    return default
+
+def tier_variant(size, index):
+    """Variante (qualidade, tamanho) de uma camada para um frame do tamanho dado"""
+    _, quality, scale = TIERS[index]
+    return quality, scaled_size(size, scale)
+
+def viewport_tier(size, viewport):
+    """Melhor camada útil para a viewport: a menor que ainda a cobre (camadas
+    maiores que a tela do cliente só gastariam banda)"""
+    target = fit_size(size, *viewport)
+    best = 0
+    for index in range(len(TIERS)):
+        if tier_variant(size, index)[1][0] >= target[0]:
+            best = index
+    return best
+
+def fast_resize(img, size):
+    """Redução rápida: primeiro por um fator inteiro com Image.reduce (média
+    de blocos, bem mais barata que um filtro completo), depois bilinear no resto"""
+    factor = min(img.size[0] // size[0], img.size[1] // size[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    if img.size != size:
+        img = img.resize(size, Image.BILINEAR)
+    return img
+
+class Frame:
+    """Frame capturado, com cache das codificações JPEG por variante
+    (qualidade, tamanho) compartilhado entre os clientes"""
+    
+    def __init__(self, image, pool=None, timestamp=None):
+        self.image = image
+        self.size = image.size
+        # Momento da captura (não da codificação), enviado aos clientes no X-Timestamp
+        self.timestamp = timestamp or time.time()
+        self.variants = {}
+        self._resized = {}
+        self._locks = {}
+        self._digest = None
+        if pool:
+            # Quando nenhum cliente referencia mais o frame, a imagem volta ao pool
+            weakref.finalize(self, pool.release, image)
+    
+    def resized(self, size):
+        """Imagem reduzida para o tamanho pedido, compartilhada entre as qualidades"""
+        if size == self.size:
+            return self.image
+        img = self._resized.get(size)
+        if img is None:
+            with self._locks.setdefault(('resize', size), threading.Lock()):
+                img = self._resized.get(size)
+                if img is None:
+                    img = self._resized[size] = fast_resize(self.image, size)
+        return img
+    
+    def digest(self):
+        """Hash dos pixels, calculado uma única vez. Capturas diferentes da mesma
+        tela (por exemplo antes e depois de uma pausa) têm o mesmo hash."""
+        if self._digest is None:
+            self._digest = hashlib.blake2b(self.image.tobytes(), digest_size=12).hexdigest()
+        return self._digest
+    
+    def encode(self, quality=JPEG_QUALITY, size=None):
+        key = (quality, size or self.size)
+        data = self.variants.get(key)
+        if data is None:
+            # Cada variante é codificada uma única vez, mesmo com vários clientes pedindo ao mesmo tempo
+            with self._locks.setdefault(key, threading.Lock()):
+                data = self.variants.get(key)
+                if data is None:
+                    data = self.variants[key] = encode_jpeg(self.resized(key[1]), quality)
+        return data
+
+def encode_screen(screen, quality=JPEG_QUALITY, timestamp=None, tiers=None):
+    """Converte e codifica uma captura (executado nas threads de codificação).
+    Com tiers, codifica as camadas do simulcast em uso no lugar da qualidade padrão."""
+    if isinstance(screen, Frame):
+        # Frame preto em cache: as variantes já codificadas são reaproveitadas
+        frame = screen
+    elif isinstance(screen, Image.Image):
+        frame = Frame(screen, timestamp=timestamp)
+    else:
+        frame = Frame(screen_to_image(screen, image_pool), image_pool, timestamp)
+    if tiers:
+        for index in tiers:
+            frame.encode(*tier_variant(frame.size, index))
+    else:
+        frame.encode(quality)
+    return frame
+
+def capture_screen(capture, monitor_index, detector=None, region=None, tiers=None):
+    """Captura e codifica o monitor. Retorna None em caso de erro ou quando o
+    detector informa que a tela não mudou."""
     try:
-        # Se for monitor secundário e não existir, retorna tela preta
-        if MONITOR_INDEX == 1 and len(sct.monitors) == 1:
-            img = Image.new('RGB', (1920, 1080), color='black')
-        else:
-            screen = sct.grab(sct.monitors[MONITOR_INDEX])
-            img = Image.frombytes("RGB", screen.size, screen.rgb)
-        
-        img_byte_array = io.BytesIO()
-        img.save(img_byte_array, format='JPEG', quality=70)
-        return img_byte_array.getvalue()
+        timestamp = time.time()
+        screen = grab_screen(capture, monitor_index, detector, region)
+        if screen is None:
+            return None
+        return encode_screen(screen, JPEG_QUALITY, timestamp, tiers)
     except Exception as e:
         logger.error(f"Erro na captura: {e}")
         return None
 
-def gen_frames():
-    global should_stop
-    if not init_screen_capture():
-        return
+class EncodePipeline:
+    """Pipeline de codificação: a captura continua enquanto frames anteriores
+    são codificados em paralelo. A fila é limitada (a captura bloqueia quando
+    ela enche) e os frames saem estritamente na ordem de captura."""
+    
+    def __init__(self, publish, workers=ENCODE_WORKERS, depth=None):
+        self.publish = publish
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='codificador')
+        self.pending = queue.Queue(maxsize=depth or workers * 2)
+        self.thread = threading.Thread(target=self._drain, daemon=True, name='publicador')
+        self.thread.start()
+    
+    def submit(self, fn, *args):
+        self.pending.put(self.executor.submit(fn, *args))
+    
+    def _drain(self):
+        while True:
+            future = self.pending.get()
+            if future is None:
+                break
+            # Espera sempre o frame mais antigo, mesmo que um mais novo já tenha terminado
+            try:
+                result = future.result()
+                if result:
+                    self.publish(result)
+            except Exception as e:
+                logger.error(f"Erro na codificação: {e}")
+    
+    def close(self):
+        self.pending.put(None)
+        self.thread.join(timeout=5)
+        self.executor.shutdown(wait=False)
 
-    while not should_stop:
+strip_executor = None
+strip_executor_lock = threading.Lock()
+
+def get_strip_executor():
+    """Pool compartilhado pelos produtores do modo por faixas"""
+    global strip_executor
+    with strip_executor_lock:
+        if strip_executor is None:
+            strip_executor = ThreadPoolExecutor(STRIP_WORKERS, thread_name_prefix='faixas')
+        return strip_executor
+
+class TileEncoder:
+    """Divide o frame em blocos e codifica em JPEG apenas os blocos que
+    mudaram desde o frame anterior. Com strips, os blocos são faixas horizontais
+    da largura do frame; com um executor, os blocos de um mesmo frame são
+    codificados em paralelo."""
+    
+    def __init__(self, tile_size=TILE_SIZE, quality=JPEG_QUALITY, strips=0, executor=None):
+        self.tile_size = tile_size
+        self.quality = quality
+        self.strips = strips
+        self.executor = executor
+        self.layout = 'strips' if strips else 'tiles'
+        self.size = None
+        self.previous = None
+        # (x, y) -> (versão, largura, altura, jpeg)
+        self.tiles = {}
+    
+    def reset(self):
+        self.size = None
+        self.previous = None
+        self.tiles = {}
+    
+    def tile_boxes(self, bbox=None):
+        """Retorna as caixas dos blocos, opcionalmente só as que cruzam bbox"""
+        width, height = self.size
+        if self.strips:
+            rows = math.ceil(height / self.strips / STRIP_ALIGN) * STRIP_ALIGN
+            return [(0, top, width, min(top + rows, height)) for top in range(0, height, rows)
+                    if not bbox or (top < bbox[3] and top + rows > bbox[1])]
+        step = self.tile_size
+        boxes = []
+        for top in range(0, height, step):
+            for left in range(0, width, step):
+                box = (left, top, min(left + step, width), min(top + step, height))
+                if bbox and (box[2] <= bbox[0] or box[0] >= bbox[2] or
+                             box[3] <= bbox[1] or box[1] >= bbox[3]):
+                    continue
+                boxes.append(box)
+        return boxes
+    
+    def encode_box(self, img, box):
+        return encode_jpeg(img.crop(box), self.quality)
+    
+    def update(self, img, version):
+        """Codifica os blocos alterados com a versão informada e retorna quantos mudaram"""
+        start = time.perf_counter()
+        if self.previous is None or img.size != self.size:
+            # Primeiro frame ou mudança de resolução: todos os blocos são novos
+            self.size = img.size
+            tiles = {}
+            boxes = self.tile_boxes()
+        else:
+            diff = ImageChops.difference(self.previous, img)
+            bbox = diff.getbbox()
+            if not bbox:
+                return 0
+            boxes = [box for box in self.tile_boxes(bbox) if diff.crop(box).getbbox()]
+            tiles = dict(self.tiles)
+        
+        if self.executor and len(boxes) > 1:
+            encoded = self.executor.map(self.encode_box, itertools.repeat(img), boxes)
+        else:
+            encoded = (self.encode_box(img, box) for box in boxes)
+        for box, data in zip(boxes, encoded):
+            tiles[(box[0], box[1])] = (version, box[2] - box[0], box[3] - box[1], data)
+        # Troca o dicionário inteiro para que leitores em outras threads
+        # nunca vejam uma atualização pela metade
+        self.tiles = tiles
+        self.previous = img
+        # Tempo do frame inteiro (com faixas em paralelo, menor que a soma dos encode_ms)
+        metrics.observe('frame_encode_ms', (time.perf_counter() - start) * 1000, layout=self.layout)
+        return len(boxes)
+    
+    def tiles_since(self, version):
+        """Blocos com versão mais nova que a informada, como (x, y, w, h, jpeg)"""
+        tiles = self.tiles
+        return [(x, y, w, h, data) for (x, y), (tile_version, w, h, data) in tiles.items()
+                if tile_version > version]
+
+def pack_tile_update(size, tiles):
+    """Monta uma mensagem binária do modo por blocos (big-endian):
+    u32 tamanho | u16 largura, u16 altura, u16 nº de blocos |
+    por bloco: u16 x, u16 y, u16 w, u16 h, u32 tamanho, jpeg"""
+    parts = [struct.pack('>HHH', size[0], size[1], len(tiles))]
+    for x, y, w, h, data in tiles:
+        parts.append(struct.pack('>HHHHI', x, y, w, h, len(data)))
+        parts.append(data)
+    body = b''.join(parts)
+    return struct.pack('>I', len(body)) + body
+
+def clamp_fps(fps):
+    return max(MIN_FPS, min(MAX_FPS, int(fps)))
+
+class FramePacer:
+    """Agendador de frames baseado em prazos: corrige a deriva acumulada e
+    descarta frames quando a captura/codificação fica para trás"""
+    
+    def __init__(self, fps):
+        self.set_fps(fps)
+        self.next_deadline = None
+        self.frames = 0
+        self.skipped = 0
+        self.achieved_fps = 0.0
+        self._window_start = time.perf_counter()
+        self._window_frames = 0
+    
+    def set_fps(self, fps):
+        self.fps = clamp_fps(fps)
+        self.interval = 1.0 / self.fps
+    
+    def wait(self):
+        """Dorme até o prazo do próximo frame"""
+        delay = self.next_delay()
+        if delay > 0:
+            time.sleep(delay)
+    
+    def next_delay(self):
+        """Avança para o próximo prazo e retorna quanto falta para ele (em segundos)"""
+        now = time.perf_counter()
+        delay = 0.0
+        if self.next_deadline is None:
+            self.next_deadline = now
+        else:
+            # O próximo prazo é calculado a partir do anterior, não de "agora",
+            # para que atrasos pequenos não se acumulem
+            self.next_deadline += self.interval
+            late = now - self.next_deadline
+            if late > self.interval:
+                # Atrasado mais de um frame: pula os prazos perdidos
+                missed = int(late / self.interval)
+                self.skipped += missed
+                self.next_deadline += missed * self.interval
+            delay = self.next_deadline - now
+        self._count_frame()
+        return delay
+    
+    def _count_frame(self):
+        self.frames += 1
+        self._window_frames += 1
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self.achieved_fps = self._window_frames / elapsed
+            self._window_start = now
+            self._window_frames = 0
+    
+    def report(self):
+        """Retorna FPS alcançado vs. alvo"""
+        return {
+            'target_fps': self.fps,
+            'achieved_fps': round(self.achieved_fps, 1),
+            'frames': self.frames,
+            'skipped': self.skipped
+        }
+
+class QualityController:
+    """Controle por realimentação de qualidade JPEG, escala e FPS de um cliente.
+    
+    O tempo de envio de cada frame (quanto o write ficou bloqueado pelo socket
+    cheio) é comparado ao intervalo entre frames. Quando o envio ocupa boa parte
+    do intervalo, a qualidade cai primeiro, depois a escala e por último o FPS;
+    quando sobra folga por um tempo, o caminho inverso é percorrido."""
+    
+    HIGH_LOAD = 0.8  # fração do intervalo acima da qual o cliente está atrasando
+    LOW_LOAD = 0.35  # abaixo disso há folga para melhorar
+    OVERLOAD = 2.0  # envio levando o dobro do intervalo: ajusta sem esperar
+    COOLDOWN = 5  # frames entre ajustes, para medir o efeito do anterior
+    
+    def __init__(self, fps):
+        self.max_fps = fps
+        self.fps = fps
+        self.quality_index = QUALITY_STEPS.index(JPEG_QUALITY) if JPEG_QUALITY in QUALITY_STEPS else 0
+        self.scale_index = 0
+        self.load = 0.0
+        self.cooldown = self.COOLDOWN
+    
+    @property
+    def quality(self):
+        return QUALITY_STEPS[self.quality_index]
+    
+    @property
+    def scale(self):
+        return SCALE_STEPS[self.scale_index]
+    
+    def update(self, send_time):
+        """Registra o tempo de envio de um frame e ajusta os parâmetros"""
+        # Média móvel exponencial da ocupação do intervalo
+        self.load = 0.7 * self.load + 0.3 * (send_time * self.fps)
+        self.cooldown -= 1
+        if self.cooldown > 0 and self.load < self.OVERLOAD:
+            return
+        
+        if self.load > self.HIGH_LOAD:
+            changed = self._degrade()
+        elif self.load < self.LOW_LOAD:
+            changed = self._improve()
+        else:
+            changed = False
+        if changed:
+            self.cooldown = self.COOLDOWN
+    
+    def _degrade(self):
+        if self.quality_index < len(QUALITY_STEPS) - 1:
+            self.quality_index += 1
+        elif self.scale_index < len(SCALE_STEPS) - 1:
+            self.scale_index += 1
+        elif self.fps > ADAPTIVE_MIN_FPS:
+            self.fps = max(ADAPTIVE_MIN_FPS, int(self.fps * 0.75))
+        else:
+            return False
+        return True
+    
+    def _improve(self):
+        if self.fps < self.max_fps:
+            self.fps = min(self.max_fps, int(self.fps / 0.75) + 1)
+        elif self.scale_index > 0:
+            self.scale_index -= 1
+        elif self.quality_index > 0:
+            self.quality_index -= 1
+        else:
+            return False
+        return True
+
+class TierController(QualityController):
+    """Controle adaptativo do simulcast: em vez de qualidade e escala livres, o
+    cliente desce e sobe entre as camadas fixas e, na última, reduz o FPS"""
+    
+    def __init__(self, fps, tier=0):
+        super().__init__(fps)
+        self.tier_index = tier
+        self.top_tier = 0  # melhor camada permitida (limitada pela viewport)
+    
+    @property
+    def quality(self):
+        return TIERS[self.tier_index][1]
+    
+    @property
+    def scale(self):
+        return TIERS[self.tier_index][2]
+    
+    def _degrade(self):
+        if self.tier_index < len(TIERS) - 1:
+            self.tier_index += 1
+        elif self.fps > ADAPTIVE_MIN_FPS:
+            self.fps = max(ADAPTIVE_MIN_FPS, int(self.fps * 0.75))
+        else:
+            return False
+        return True
+    
+    def _improve(self):
+        if self.fps < self.max_fps:
+            self.fps = min(self.max_fps, int(self.fps / 0.75) + 1)
+        elif self.tier_index > self.top_tier:
+            self.tier_index -= 1
+        else:
+            return False
+        return True
+
+class FrameHub:
+    """Produtor único de captura/codificação de um monitor, distribuindo o
+    último frame codificado para todos os clientes conectados"""
+    
+    mode = 'mjpeg'
+    
+    def __init__(self, monitor_index, region=None):
+        self.monitor_index = monitor_index
+        self.region = region
+        self.condition = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.subscribers = 0
+        self.client_fps = []
+        self.thread = None
+        self.pacer = FramePacer(TARGET_FPS)
+        self.pipeline = None
+        # Slots de entrega dos clientes (ver FrameSlot)
+        self.slots = set()
+        # Clientes por camada do simulcast: o produtor codifica só as camadas em uso
+        self.tier_counts = collections.Counter()
+    
+    def producer_fps(self):
+        """O produtor roda no FPS do servidor ou no maior FPS pedido por um cliente"""
+        return max([TARGET_FPS] + self.client_fps)
+    
+    def subscribe(self, fps=None):
+        """Registra um cliente e inicia o produtor se necessário"""
+        with self.condition:
+            self.subscribers += 1
+            if fps:
+                self.client_fps.append(fps)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True,
+                                               name=f"captura-monitor-{self.monitor_index}")
+                self.thread.start()
+            self.condition.notify_all()
+    
+    def unsubscribe(self, fps=None):
+        """Remove um cliente; sem clientes o produtor fica em pausa"""
+        with self.condition:
+            self.subscribers = max(0, self.subscribers - 1)
+            if fps in self.client_fps:
+                self.client_fps.remove(fps)
+            self.condition.notify_all()
+    
+    def use_tier(self, old, new):
+        """Registra a troca de camada de um cliente (None = nenhuma)"""
+        with self.condition:
+            if old is not None:
+                self.tier_counts[old] -= 1
+            if new is not None:
+                self.tier_counts[new] += 1
+    
+    def active_tiers(self):
+        with self.condition:
+            return sorted(index for index, count in self.tier_counts.items() if count > 0)
+    
+    def wait_frame(self, last_seq, timeout=1.0):
+        """Aguarda um frame mais novo que last_seq e retorna (seq, frame)"""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: (self.frame is not None and self.seq != last_seq) or should_stop, timeout)
+            return self.seq, self.frame
+    
+    def _publish(self, frame):
+        with self.condition:
+            if self.subscribers == 0:
+                # Frame que terminou de ser codificado depois da pausa
+                return
+            self.frame = frame
+            self.seq += 1
+            self.condition.notify_all()
+            seq, slots = self.seq, list(self.slots)
+        for slot in slots:
+            slot.put(seq, frame)
+    
+    def _produce(self, capture, detector):
+        """Captura um frame e retorna o que deve ser publicado (um Frame ou None)"""
+        # Frames iguais ao anterior não são codificados nem publicados
+        if self.pipeline is None:
+            return capture_screen(capture, self.monitor_index, detector, self.region, self.active_tiers())
+        
+        try:
+            timestamp = time.time()
+            screen = grab_screen(capture, self.monitor_index, detector, self.region)
+            if screen is not None:
+                # Publicado pelo pipeline quando a codificação terminar
+                self.pipeline.submit(encode_screen, screen, JPEG_QUALITY, timestamp, self.active_tiers())
+        except Exception as e:
+            logger.error(f"Erro na captura: {e}")
+        return None
+    
+    def _start_pipeline(self):
+        if ENCODE_WORKERS <= 1:
+            return None
+        pipeline = EncodePipeline(self._publish)
+        with self.condition:
+            self.pipeline = pipeline
+        return pipeline
+    
+    def _stop_pipeline(self, pipeline):
+        # Um produtor novo (depois de um encerramento) pode já ter criado o seu
+        with self.condition:
+            if self.pipeline is pipeline:
+                self.pipeline = None
+        if pipeline:
+            pipeline.close()
+    
+    def _wait_subscribers(self):
+        """Espera (com self.condition) até haver clientes. Retorna False se o
+        produtor deve encerrar: produtor de região ocioso por REGION_HUB_LINGER"""
+        while self.subscribers == 0 and not should_stop:
+            if self.region is None:
+                self.condition.wait()
+            elif not self.condition.wait(REGION_HUB_LINGER) and self.subscribers == 0:
+                # O próximo subscribe inicia outro produtor
+                self.thread = None
+                return False
+        return True
+    
+    def _retire(self):
+        """Remove o produtor encerrado da tabela, se ninguém voltou a usá-lo"""
+        key = (self.monitor_index, self.mode, self.region)
+        with hubs_lock:
+            with self.condition:
+                if hubs.get(key) is self and self.thread is None:
+                    del hubs[key]
+                    logger.info(f"Produtor da região {self.region} removido")
+    
+    def _reset(self):
+        """Chamado quando o produtor entra em pausa"""
+        self.frame = None
+    
+    def _run(self):
+        # O mss não é thread-safe, então o produtor tem sua própria instância
+        capture = create_screen_capture(self.monitor_index)
+        if capture is None:
+            return
+        detector = ChangeDetector()
+        pipeline = self._start_pipeline()
+        retired = False
+        
+        last_report = time.perf_counter()
         try:
-            frame = capture_screen()
-            if frame:
-                yield (b'--frame\r\n'
-                      b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            while not should_stop:
+                with self.condition:
+                    # Pausa enquanto não houver clientes conectados
+                    if self.subscribers == 0:
+                        logger.info(f"Captura do monitor {self.monitor_index} em pausa")
+                        self._reset()
+                        self.pacer.next_deadline = None
+                        detector.previous = None
+                    if not self._wait_subscribers():
+                        retired = True
+                        break
+                    self.pacer.set_fps(self.producer_fps())
+                if should_stop:
+                    break
+                
+                self.pacer.wait()
+                if time.perf_counter() - last_report >= FPS_REPORT_INTERVAL:
+                    last_report = time.perf_counter()
+                    stats = self.pacer.report()
+                    logger.info(f"Monitor {self.monitor_index}: {stats['achieved_fps']}/{stats['target_fps']} fps "
+                                f"(frames descartados: {stats['skipped']})")
+                
+                frame = self._produce(capture, detector)
+                if frame:
+                    self._publish(frame)
+        except Exception as e:
+            logger.error(f"Erro no produtor de captura: {e}")
+        finally:
+            self._stop_pipeline(pipeline)
+            capture.close()
+        if retired:
+            self._retire()
+
+class TileHub(FrameHub):
+    """Produtor do modo por blocos: publica apenas os blocos alterados"""
+    
+    mode = 'tiles'
+    
+    def __init__(self, monitor_index, region=None):
+        super().__init__(monitor_index, region)
+        self.tiler = TileEncoder()
+    
+    def _start_pipeline(self):
+        # Cada frame depende do anterior, então a codificação é sequencial
+        pass
+    
+    def _produce(self, capture, detector):
+        try:
+            img = grab_image(capture, self.monitor_index, detector, self.region)
+            if img is None:
+                return None
+            if self.tiler.update(img, self.seq + 1) == 0:
+                return None
+            # O "frame" publicado é só o tamanho; os blocos ficam no tiler
+            return img.size
         except Exception as e:
-            logger.error(f"Erro no streaming: {e}")
-            break
+            logger.error(f"Erro na captura por blocos: {e}")
+            return None
+    
+    def _reset(self):
+        super()._reset()
+        self.tiler.reset()
+    
+    def tiles_since(self, version):
+        with self.condition:
+            return self.frame, self.tiler.tiles_since(version)
+
+class StripHub(TileHub):
+    """Produtor do modo por faixas: mesmo protocolo dos blocos, com o frame
+    dividido em faixas horizontais codificadas em paralelo"""
+    
+    mode = 'strips'
+    
+    def __init__(self, monitor_index, region=None):
+        super().__init__(monitor_index, region)
+        self.tiler = TileEncoder(strips=STRIP_WORKERS, executor=get_strip_executor())
+
+# Um produtor por monitor, modo e região, compartilhado entre todos os clientes
+hubs = {}
+hubs_lock = threading.Lock()
+
+def get_hub(monitor_index, hub_class=FrameHub, region=None):
+    key = (monitor_index, hub_class.mode, region)
+    with hubs_lock:
+        hub = hubs.get(key)
+        if hub is None:
+            hub = hubs[key] = hub_class(monitor_index, region)
+        return hub
+
+def load_regions():
+    """Regiões nomeadas salvas no settings.json"""
+    try:
+        if os.path.exists(SETTINGS_FILE):
+            with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f).get('regions', {})
+    except Exception as e:
+        logger.error(f"Erro ao carregar regiões: {e}")
+    return {}
+
+def parse_region(args):
+    """Região de captura do cliente: crop=x,y,largura,altura ou region=<nome>.
+    Retorna (left, top, width, height), None para o monitor inteiro, ou lança
+    ValueError se o pedido for inválido."""
+    if args.get('region'):
+        region = load_regions().get(args['region'])
+        if region is None:
+            raise ValueError(f"Região desconhecida: {args['region']}")
+        values = (region['left'], region['top'], region['width'], region['height'])
+    elif args.get('crop'):
+        values = args['crop'].split(',')
+        if len(values) != 4:
+            raise ValueError("Use crop=x,y,largura,altura")
+    else:
+        return None
+    left, top, width, height = (int(value) for value in values)
+    if left < 0 or top < 0 or width <= 0 or height <= 0:
+        raise ValueError("Região inválida")
+    return (left, top, width, height)
+
+MJPEG_BOUNDARY = b'--frame\r\n'
+MJPEG_PART_END = b'\r\n'
+
+def mjpeg_part(data, timestamp=None):
+    """Partes de um frame multipart enviadas como pedaços separados, para que
+    o JPEG seja escrito no socket sem ser concatenado aos cabeçalhos.
+    O X-Timestamp (momento da captura) permite medir a latência nos clientes."""
+    yield MJPEG_BOUNDARY
+    if timestamp:
+        yield b'Content-Type: image/jpeg\r\nContent-Length: %d\r\nX-Timestamp: %.6f\r\n\r\n' % (len(data), timestamp)
+    else:
+        yield b'Content-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n' % len(data)
+    yield data
+    yield MJPEG_PART_END
+
+class FrameSlot:
+    """Entrega com profundidade um: enquanto o cliente ainda está enviando,
+    frames mais novos substituem o pendente. O atraso de um cliente lento
+    fica limitado a um frame, em vez de uma fila crescendo no socket."""
+    
+    def __init__(self, notify=None):
+        self.condition = threading.Condition()
+        self.pending = None  # (seq, frame)
+        self.notify = notify
+        self.delivered = 0
+        self.dropped = 0
+    
+    def put(self, seq, frame):
+        with self.condition:
+            if self.pending is not None:
+                # O frame pendente nunca chegou a ser enviado
+                self.dropped += 1
+            self.pending = (seq, frame)
+            self.condition.notify()
+        if self.notify:
+            self.notify()
+    
+    def take(self, timeout=None):
+        """Aguarda e retira o frame pendente; retorna (seq, frame) ou None"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending is not None or should_stop, timeout)
+            return self._pop()
+    
+    def poll(self):
+        """Retira o frame pendente sem esperar"""
+        with self.condition:
+            return self._pop()
+    
+    def _pop(self):
+        item, self.pending = self.pending, None
+        if item is not None:
+            self.delivered += 1
+        return item
+
+def limit_send_buffer(sock):
+    """Reduz o buffer de envio do kernel para que frames não se acumulem nele"""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, STREAM_SNDBUF)
+    except (OSError, AttributeError):
+        pass
+
+# Clientes conectados, para as métricas
+client_ids = itertools.count(1)
+active_clients = {}
+clients_lock = threading.Lock()
+dropped_total = 0  # frames descartados de clientes que já desconectaram
+
+class StreamClient:
+    """Estado de um cliente do /video_feed: monitor, ritmo, controle adaptativo
+    e keepalive. Usado tanto pelo gerador do Flask quanto pelo servidor asyncio."""
+    
+    def __init__(self, fps=None, adaptive=True, viewport=None, notify=None, address=None, monitor=None,
+                 region=None, tier=None):
+        self.id = next(client_ids)
+        self.address = address
+        self.fps = fps
+        self.viewport = viewport
+        self.send_ms = RollingHistogram()
+        # Frames chegam por um slot de profundidade um (o mais recente vence)
+        self.slot = FrameSlot(notify)
+        # Com monitor fixo (/video_feed/<index>) o cliente ignora o /monitor/<index>
+        self.pinned = monitor is not None
+        self.monitor_index = monitor if self.pinned else MONITOR_INDEX
+        self.region = region
+        # Camada do simulcast pedida (tier=<nome>) e a efetivamente em uso no hub
+        self.tier = tier_index(tier)
+        self.tier_in_use = None
+        self.hub = None
+        self._attach(get_hub(self.monitor_index, region=region))
+        # Sem FPS próprio o cliente acompanha o produtor
+        self.pacer = FramePacer(fps) if fps else None
+        if not adaptive:
+            self.controller = None
+        elif SIMULCAST:
+            self.controller = TierController(fps or self.hub.producer_fps(), self.tier)
+        else:
+            self.controller = QualityController(fps or self.hub.producer_fps())
+        self.last_frame = None
+        self.last_sent = time.perf_counter()
+        self.keepalive = False
+        with clients_lock:
+            active_clients[self.id] = self
+    
+    def _attach(self, hub):
+        self.hub = hub
+        hub.subscribe(self.fps)
+        hub.use_tier(None, self.tier_in_use)
+        with hub.condition:
+            hub.slots.add(self.slot)
+            seq, frame = hub.seq, hub.frame
+        # Entrega imediatamente o frame atual para quem acabou de conectar
+        if frame is not None:
+            self.slot.put(seq, frame)
+    
+    def _detach(self):
+        with self.hub.condition:
+            self.hub.slots.discard(self.slot)
+        self.hub.use_tier(self.tier_in_use, None)
+        self.hub.unsubscribe(self.fps)
+    
+    def follow_monitor(self):
+        """Acompanha a troca de monitor feita em /monitor/<index>"""
+        if not self.pinned and MONITOR_INDEX != self.monitor_index:
+            self._detach()
+            self.monitor_index = MONITOR_INDEX
+            self._attach(get_hub(self.monitor_index, region=self.region))
+    
+    def pace_delay(self):
+        """Tempo a esperar antes do próximo frame deste cliente"""
+        controller = self.controller
+        if controller and controller.fps != (self.pacer.fps if self.pacer else self.hub.producer_fps()):
+            # O controle reduziu (ou restaurou) o FPS deste cliente
+            self.pacer = self.pacer or FramePacer(controller.fps)
+            self.pacer.set_fps(controller.fps)
+        return self.pacer.next_delay() if self.pacer else 0.0
+    
+    def wait_timeout(self):
+        return max(0.1, KEEPALIVE_INTERVAL - (time.perf_counter() - self.last_sent))
+    
+    def select(self, item):
+        """Decide o que enviar a partir do que saiu do slot (ou None, se não
+        chegou nada); retorna (frame, (qualidade, tamanho)) ou None"""
+        # Tela parada: reenvia o último frame já codificado como keepalive
+        self.keepalive = item is None and time.perf_counter() - self.last_sent >= KEEPALIVE_INTERVAL
+        if item is not None:
+            frame = self.last_frame = item[1]
+        elif self.keepalive and self.last_frame is not None:
+            frame = self.last_frame
+            if self.pacer:
+                # Depois de uma pausa longa, recomeça a contagem de prazos
+                self.pacer.next_deadline = None
+        else:
+            return None
+        
+        if SIMULCAST:
+            return frame, tier_variant(frame.size, self._select_tier(frame.size))
+        
+        size = fit_size(frame.size, *self.viewport) if self.viewport else frame.size
+        if self.controller:
+            return frame, (self.controller.quality, scaled_size(size, self.controller.scale))
+        return frame, (JPEG_QUALITY, size)
+    
+    def _select_tier(self, size):
+        top = viewport_tier(size, self.viewport) if self.viewport else 0
+        if self.controller:
+            self.controller.top_tier = top
+            self.controller.tier_index = max(self.controller.tier_index, top)
+            tier = self.controller.tier_index
+        else:
+            tier = max(self.tier, top)
+        if tier != self.tier_in_use:
+            # O produtor passa a pré-codificar a nova camada
+            self.hub.use_tier(self.tier_in_use, tier)
+            self.tier_in_use = tier
+        return tier
+    
+    def sent(self, send_time):
+        self.last_sent = time.perf_counter()
+        self.send_ms.observe(send_time * 1000)
+        if self.controller and not self.keepalive:
+            self.controller.update(send_time)
+    
+    def report(self):
+        report = {
+            'address': self.address,
+            'monitor': self.monitor_index,
+            'region': self.region,
+            'delivered': self.slot.delivered,
+            'dropped': self.slot.dropped,
+            'send_ms': self.send_ms.snapshot()
+        }
+        if self.tier_in_use is not None:
+            report.update(tier=TIERS[self.tier_in_use][0])
+        if self.controller:
+            report.update(quality=self.controller.quality, scale=self.controller.scale,
+                          fps=self.controller.fps)
+        return report
+    
+    def close(self):
+        global dropped_total
+        with clients_lock:
+            active_clients.pop(self.id, None)
+            dropped_total += self.slot.dropped
+        self._detach()
+        logger.info(f"Cliente desconectado: {self.slot.delivered} frames entregues, "
+                    f"{self.slot.dropped} substituídos por mais recentes")
+
+def gen_frames(fps=None, adaptive=True, viewport=None, sock=None, address=None, monitor=None, region=None,
+               tier=None):
+    client = StreamClient(fps, adaptive, viewport, address=address, monitor=monitor, region=region, tier=tier)
+    if sock:
+        limit_send_buffer(sock)
+    try:
+        while not should_stop:
+            client.follow_monitor()
+            delay = client.pace_delay()
+            if delay > 0:
+                time.sleep(delay)
+            job = client.select(client.slot.take(client.wait_timeout()))
+            if job is None:
+                continue
+            
+            frame, variant = job
+            data = frame.encode(*variant)
+            start = time.perf_counter()
+            yield from mjpeg_part(data, frame.timestamp)
+            # O gerador só é retomado depois que o servidor escreveu o frame
+            client.sent(time.perf_counter() - start)
+    except Exception as e:
+        logger.error(f"Erro no streaming: {e}")
+    finally:
+        client.close()
+
+def parse_viewport(args):
+    """Viewport do cliente (em pixels CSS) e device pixel ratio, informados pela
+    página. Valores inválidos (zero, negativos, nan) dão None: tamanho cheio."""
+    try:
+        width = int(args.get('w', 0))
+        height = int(args.get('h', 0))
+        dpr = float(args.get('dpr', 1.0))
+    except (ValueError, TypeError, OverflowError):
+        return None
+    if width > 0 and height > 0 and math.isfinite(dpr) and dpr > 0:
+        return (width, height, dpr)
+    return None
 
 @app.route('/video_feed')
-def video_feed():
-    return Response(gen_frames(),
+@app.route('/video_feed/<int:index>')
+def video_feed(index=None):
+    # Sem índice o stream segue o monitor global; com índice, cada aparelho
+    # pode mostrar um monitor diferente
+    if index is not None and not valid_monitor(index):
+        return 'Monitor não encontrado', 404
+    try:
+        region = parse_region(request.args)
+    except (ValueError, KeyError, TypeError) as e:
+        return f'Região inválida: {e}', 400
+    fps = request.args.get('fps', type=int)
+    if fps:
+        fps = clamp_fps(fps)
+    adaptive = request.args.get('adaptive', '1') != '0'
+    return Response(gen_frames(fps, adaptive, parse_viewport(request.args),
+                               request.environ.get('werkzeug.socket'), request.remote_addr, index, region, request.args.get('tier')),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
+def gen_tiles(fps=None, hub_class=TileHub):
+    monitor_index = MONITOR_INDEX
+    hub = get_hub(monitor_index, hub_class)
+    hub.subscribe(fps)
+    pacer = FramePacer(fps) if fps else None
+    # Versão 0: o primeiro envio contém todos os blocos (quadro completo)
+    last_seq = 0
+    last_sent = time.perf_counter()
+    
+    try:
+        while not should_stop:
+            if MONITOR_INDEX != monitor_index:
+                hub.unsubscribe(fps)
+                monitor_index = MONITOR_INDEX
+                hub = get_hub(monitor_index, hub_class)
+                hub.subscribe(fps)
+                last_seq = 0
+            
+            if pacer:
+                pacer.wait()
+            timeout = max(0.1, KEEPALIVE_INTERVAL - (time.perf_counter() - last_sent))
+            seq, size = hub.wait_frame(last_seq, timeout)
+            if not size:
+                continue
+            
+            if seq != last_seq:
+                size, tiles = hub.tiles_since(last_seq)
+                last_seq = seq
+            elif time.perf_counter() - last_sent >= KEEPALIVE_INTERVAL:
+                # Keepalive: mensagem sem blocos
+                tiles = []
+                if pacer:
+                    pacer.next_deadline = None
+            else:
+                continue
+            last_sent = time.perf_counter()
+            yield pack_tile_update(size, tiles)
+    except Exception as e:
+        logger.error(f"Erro no streaming por blocos: {e}")
+    finally:
+        hub.unsubscribe(fps)
+
+@app.route('/tiles_feed')
+def tiles_feed():
+    fps = request.args.get('fps', type=int)
+    if fps:
+        fps = clamp_fps(fps)
+    # layout=strips: faixas horizontais codificadas em paralelo (menor latência por frame)
+    hub_class = StripHub if request.args.get('layout') == 'strips' else TileHub
+    return Response(gen_tiles(fps, hub_class), mimetype='application/octet-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/fps/<int:fps>')
+def set_fps(fps):
+    global TARGET_FPS
+    TARGET_FPS = clamp_fps(fps)
+    return f'FPS alvo alterado para {TARGET_FPS}'
+
+def hub_name(key):
+    """Nome do produtor nas métricas: monitor:modo, mais a região se houver"""
+    index, mode, region = key
+    name = f"{index}:{mode}"
+    if region:
+        name += ':' + ','.join(str(value) for value in region)
+    return name
+
+@app.route('/stats')
+def stats():
+    with hubs_lock:
+        return {hub_name(key): hub.pacer.report() for key, hub in hubs.items()}
+
+def producer_reports():
+    """(chave do produtor, relatório do pacer) de cada produtor"""
+    with hubs_lock:
+        return [(key, hub.pacer.report()) for key, hub in hubs.items()]
+
+def metrics_snapshot():
+    """Todas as métricas em um dicionário (formato do /metrics.json)"""
+    producers = {hub_name(key): report for key, report in producer_reports()}
+    with clients_lock:
+        clients = {str(client_id): client.report() for client_id, client in active_clients.items()}
+        dropped = dropped_total + sum(client['dropped'] for client in clients.values())
+    stages = {}
+    for (name, labels), hist in list(metrics.histograms.items()):
+        key = name + ''.join(f"{{{k}={v}}}" for k, v in labels)
+        stages[key] = hist.snapshot()
+    return {'stages': stages, 'producers': producers, 'clients': clients, 'dropped_total': dropped,
+            'encoder': jpeg_encoder.name}
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+def render_metrics_text():
+    """Métricas no formato de texto do Prometheus"""
+    lines = []
+    typed = set()
+    for (name, labels), hist in sorted(list(metrics.histograms.items()), key=lambda item: item[0]):
+        # Histograma com os contadores acumulados; a janela fica para o /metrics.json
+        totals = hist.totals()
+        metric = f"screen_server_{name}"
+        # Um único # TYPE por métrica: os conjuntos de rótulos vêm em sequência
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {metric} histogram")
+        for le, count in totals['buckets'].items():
+            lines.append(f"{metric}_bucket{format_labels(labels + (('le', le),))} {count}")
+        lines.append(f"{metric}_bucket{format_labels(labels + (('le', '+Inf'),))} {totals['count']}")
+        lines.append(f"{metric}_sum{format_labels(labels)} {totals['sum']}")
+        lines.append(f"{metric}_count{format_labels(labels)} {totals['count']}")
+    
+    snapshot = metrics_snapshot()
+    producers = producer_reports()
+    for gauge in ('achieved_fps', 'target_fps'):
+        lines.append(f"# TYPE screen_server_{gauge} gauge")
+        for (index, mode, region), report in producers:
+            region = ','.join(str(value) for value in region) if region else ''
+            labels = format_labels((('monitor', index), ('mode', mode), ('region', region)))
+            lines.append(f"screen_server_{gauge}{labels} {report[gauge]}")
+    
+    lines.append("# TYPE screen_server_client_send_ms summary")
+    for client_id, report in snapshot['clients'].items():
+        labels = (('client', client_id), ('address', report['address']))
+        send = report['send_ms']
+        for key, quantile in (('p50', '0.5'), ('p90', '0.9'), ('p99', '0.99')):
+            if key in send:
+                lines.append(f"screen_server_client_send_ms{format_labels(labels + (('quantile', quantile),))} {send[key]}")
+        lines.append(f"screen_server_client_send_ms_sum{format_labels(labels)} {send.get('sum', 0)}")
+        lines.append(f"screen_server_client_send_ms_count{format_labels(labels)} {send['count']}")
+    lines.append("# TYPE screen_server_client_dropped_frames counter")
+    for client_id, report in snapshot['clients'].items():
+        labels = (('client', client_id), ('address', report['address']))
+        lines.append(f"screen_server_client_dropped_frames{format_labels(labels)} {report['dropped']}")
+    lines.append("# TYPE screen_server_dropped_frames_total counter")
+    lines.append(f"screen_server_dropped_frames_total {snapshot['dropped_total']}")
+    return '\n'.join(lines) + '\n'
+
+@app.route('/metrics')
+def metrics_text():
+    return Response(render_metrics_text(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics.json')
+def metrics_json():
+    return jsonify(metrics_snapshot())
+
+# Hubs mantidos ativos pelo /snapshot.jpg -> prazo de expiração
+snapshot_holds = {}
+snapshot_tiers = {}  # hub -> camadas registradas pelas reservas do snapshot
+snapshot_lock = threading.Lock()
+snapshot_reaper = None
+
+def hold_for_snapshot(hub, linger=SNAPSHOT_LINGER, tier=None):
+    """Mantém o produtor do hub ativo por um tempo após o último pedido, para
+    que polls seguidos encontrem o último frame já codificado em memória. A
+    camada pedida fica registrada no hub, então o produtor já codifica a
+    variante servida."""
+    global snapshot_reaper
+    with snapshot_lock:
+        if hub not in snapshot_holds:
+            hub.subscribe()
+        snapshot_holds[hub] = max(snapshot_holds.get(hub, 0), time.monotonic() + linger)
+        tiers = snapshot_tiers.setdefault(hub, set())
+        if tier is not None and tier not in tiers:
+            tiers.add(tier)
+            hub.use_tier(None, tier)
+        if snapshot_reaper is None:
+            snapshot_reaper = threading.Thread(target=release_snapshot_holds, daemon=True, name='snapshot')
+            snapshot_reaper.start()
+
+def release_snapshot_holds():
+    global snapshot_reaper
+    while not should_stop:
+        time.sleep(1.0)
+        now = time.monotonic()
+        with snapshot_lock:
+            for hub, deadline in list(snapshot_holds.items()):
+                if deadline <= now:
+                    del snapshot_holds[hub]
+                    for tier in snapshot_tiers.pop(hub, ()):
+                        hub.use_tier(tier, None)
+                    hub.unsubscribe()
+            if not snapshot_holds:
+                snapshot_reaper = None
+                return
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags
+
+def snapshot(args, if_none_match=None):
+    """Último frame codificado como JPEG avulso: (status, cabeçalhos, corpo).
+    Com If-None-Match igual ao frame atual responde 304 sem codificar nada;
+    com wait=<segundos> espera antes por um frame diferente (long-poll)."""
+    try:
+        monitor = int(args.get('monitor', MONITOR_INDEX))
+        wait = min(max(0.0, float(args.get('wait', 0))), SNAPSHOT_MAX_WAIT)
+    except ValueError:
+        return '400 Bad Request', {'Content-Type': 'text/plain; charset=utf-8'}, 'Parâmetros inválidos'.encode()
+    if not valid_monitor(monitor):
+        return '404 Not Found', {'Content-Type': 'text/plain; charset=utf-8'}, 'Monitor não encontrado'.encode()
+    
+    tier = tier_index(args.get('tier'))
+    hub = get_hub(monitor)
+    hold_for_snapshot(hub, max(SNAPSHOT_LINGER, wait + 1), tier if SIMULCAST else None)
+    seq, frame = hub.wait_frame(-1, SNAPSHOT_FIRST_WAIT)
+    if frame is None:
+        return ('503 Service Unavailable', {'Content-Type': 'text/plain; charset=utf-8', 'Retry-After': '1'},
+                'Nenhum frame disponível'.encode())
+    
+    def tag(frame):
+        # O ETag vem do conteúdo, não do número do frame: a captura pausa sem
+        # pedidos e recomeça com frames novos, mas a tela pode ser a mesma
+        quality, size = tier_variant(frame.size, tier) if SIMULCAST else (JPEG_QUALITY, frame.size)
+        return f'"{SERVER_ID}-{monitor}-{frame.digest()}-{quality}-{size[0]}x{size[1]}"', (quality, size)
+    
+    etag, variant = tag(frame)
+    if etag_matches(if_none_match, etag) and wait > 0:
+        # Long-poll: só responde quando a tela mudar (ou no fim da espera)
+        deadline = time.monotonic() + wait
+        while (remaining := deadline - time.monotonic()) > 0:
+            new_seq, new_frame = hub.wait_frame(seq, remaining)
+            if new_frame is None or new_seq == seq:
+                break
+            seq, frame = new_seq, new_frame
+            etag, variant = tag(frame)
+            if not etag_matches(if_none_match, etag):
+                break
+    
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag_matches(if_none_match, etag):
+        return '304 Not Modified', headers, b''
+    headers.update({'Content-Type': 'image/jpeg', 'X-Timestamp': f'{frame.timestamp:.6f}'})
+    return '200 OK', headers, frame.encode(*variant)
+
+@app.route('/snapshot.jpg')
+def snapshot_jpg():
+    status, headers, body = snapshot(request.args, request.headers.get('If-None-Match'))
+    return Response(body, status=status, headers=headers)
+
 @app.route('/shutdown', methods=['GET'])
 def shutdown():
     global should_stop
@@ -113,6 +1691,7 @@ def set_monitor(index):
 
 @app.route('/')
 def index():
+    # A porta do WebSocket só difere da página no modo Flask (servidor auxiliar)
     return """
     <html>
     <head>
@@ -124,11 +1703,11 @@ def index():
                 background: black;
                 overflow: hidden; 
             }
-            img { 
+            img, canvas { 
                 width: 100vw; 
                 height: 100vh; 
                 object-fit: contain;
-                display: block;
+                display: none;
             }
             #status {
                 position: fixed;
@@ -159,45 +1738,612 @@ def index():
     <body>
         <div id="status">Conectando...</div>
         <div id="error">Erro na conexão!<br>Tentando reconectar...</div>
-        <img src="/video_feed" onerror="onError()" onload="onLoad()"/>
+        <canvas id="screen"></canvas>
+        <img onerror="onError()" onload="onLoad()"/>
         <script>
+            const canvas = document.getElementById('screen');
+            const ctx = canvas.getContext('2d');
+            const img = document.querySelector('img');
+            const wsPort = '__WS_PORT__' || window.location.port;
             let errorCount = 0;
+            let socket = null;
+            let mjpeg = false;  // WebSocket indisponível: usa o MJPEG no <img>
             
-            function onError() {
+            // /?monitor=N fixa o monitor deste aparelho; region=<nome> ou
+            // crop=x,y,largura,altura transmitem só parte dele; tier=<camada>
+            // escolhe a camada inicial do simulcast
+            const pageArgs = new URLSearchParams(window.location.search);
+            const monitor = pageArgs.get('monitor');
+            const regionArgs = ['region', 'crop', 'tier'].filter(name => pageArgs.get(name))
+                .map(name => '&' + name + '=' + encodeURIComponent(pageArgs.get(name))).join('');
+            
+            // Informa a viewport para o servidor reduzir a imagem antes de codificar
+            function viewportArgs() {
+                return 'w=' + window.innerWidth + '&h=' + window.innerHeight +
+                       '&dpr=' + (window.devicePixelRatio || 1) + regionArgs;
+            }
+            
+            function feedUrl() {
+                const path = monitor === null ? '/video_feed' : '/video_feed/' + monitor;
+                return path + '?' + viewportArgs() + '&t=' + new Date().getTime();
+            }
+            
+            function wsUrl() {
+                const scheme = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+                const path = monitor === null ? '/ws' : '/ws/' + monitor;
+                return scheme + window.location.hostname + (wsPort ? ':' + wsPort : '') + path + '?' + viewportArgs();
+            }
+            
+            function showConnected() {
+                errorCount = 0;
+                document.getElementById('status').innerHTML = 'Conectado';
+                document.getElementById('status').style.background = 'rgba(0,255,0,0.5)';
+                document.getElementById('error').style.display = 'none';
+            }
+            
+            function showError() {
                 errorCount++;
                 document.getElementById('status').innerHTML = 'Erro na conexão!';
                 document.getElementById('status').style.background = 'rgba(255,0,0,0.5)';
                 document.getElementById('error').style.display = 'block';
-                
+            }
+            
+            // Cada mensagem binária: u32 id do frame, f64 momento da captura, JPEG.
+            // O ack só é enviado depois do frame desenhado, então o servidor envia
+            // no ritmo real de decodificação do aparelho
+            let rendering = Promise.resolve();
+            function paint(data) {
+                const id = new DataView(data).getUint32(0);
+                const blob = new Blob([new Uint8Array(data, 12)], {type: 'image/jpeg'});
+                return createImageBitmap(blob).then(bitmap => {
+                    if (canvas.width !== bitmap.width || canvas.height !== bitmap.height) {
+                        canvas.width = bitmap.width;
+                        canvas.height = bitmap.height;
+                    }
+                    ctx.drawImage(bitmap, 0, 0);
+                    bitmap.close();
+                }).catch(e => console.log(e)).then(() => {
+                    if (socket && socket.readyState === WebSocket.OPEN) {
+                        socket.send(JSON.stringify({ack: id}));
+                    }
+                });
+            }
+            
+            function connect() {
+                let opened = false;
+                socket = new WebSocket(wsUrl());
+                socket.binaryType = 'arraybuffer';
+                socket.onopen = () => {
+                    opened = true;
+                    canvas.style.display = 'block';
+                    showConnected();
+                };
+                socket.onmessage = event => {
+                    // Desenha na ordem de chegada
+                    rendering = rendering.then(() => paint(event.data));
+                };
+                socket.onclose = () => {
+                    socket = null;
+                    showError();
+                    if (!opened && errorCount >= 3) {
+                        // Nunca abriu (proxy ou servidor sem WebSocket): volta ao MJPEG
+                        mjpeg = true;
+                        errorCount = 0;
+                        canvas.style.display = 'none';
+                        img.style.display = 'block';
+                        img.src = feedUrl();
+                    } else if (errorCount < 5) {
+                        setTimeout(connect, 1000 * errorCount);
+                    }
+                };
+            }
+            
+            let resizeTimer = null;
+            window.addEventListener('resize', () => {
+                clearTimeout(resizeTimer);
+                resizeTimer = setTimeout(() => {
+                    if (mjpeg) {
+                        img.src = feedUrl();
+                    } else if (socket && socket.readyState === WebSocket.OPEN) {
+                        // A viewport muda pelo próprio canal, sem reconectar
+                        socket.send(JSON.stringify({viewport: [window.innerWidth, window.innerHeight,
+                                                               window.devicePixelRatio || 1]}));
+                    }
+                }, 500);
+            });
+            
+            function onError() {
+                showError();
                 if (errorCount < 5) {
                     setTimeout(() => {
                         // Tenta reconectar
-                        document.querySelector('img').src = '/video_feed?' + new Date().getTime();
+                        img.src = feedUrl();
                     }, 1000);
                 }
             }
             
             function onLoad() {
-                errorCount = 0;
-                document.getElementById('status').innerHTML = 'Conectado';
-                document.getElementById('status').style.background = 'rgba(0,255,0,0.5)';
-                document.getElementById('error').style.display = 'none';
+                showConnected();
+            }
+            
+            connect();
+        </script>
+    </body>
+    </html>
+    """.replace('__WS_PORT__', str(WEBSOCKET_PORT or ''))
+
+@app.route('/tiles')
+def tiles():
+    return """
+    <html>
+    <head>
+        <title>Segunda Tela PC (blocos)</title>
+        <meta name="viewport" content="width=device-width, initial-scale=1">
+        <style>
+            body { 
+                margin: 0; 
+                background: black;
+                overflow: hidden; 
+            }
+            canvas { 
+                width: 100vw; 
+                height: 100vh; 
+                object-fit: contain;
+                display: block;
+            }
+            #status {
+                position: fixed;
+                top: 10px;
+                left: 10px;
+                color: white;
+                background: rgba(0,0,0,0.5);
+                padding: 5px 10px;
+                border-radius: 5px;
+                font-family: Arial;
+                z-index: 1000;
+            }
+        </style>
+    </head>
+    <body>
+        <div id="status">Conectando...</div>
+        <canvas id="screen"></canvas>
+        <script>
+            const canvas = document.getElementById('screen');
+            const ctx = canvas.getContext('2d');
+            const status = document.getElementById('status');
+            let errorCount = 0;
+            
+            function setStatus(text, color) {
+                status.innerHTML = text;
+                status.style.background = color;
+            }
+            
+            // Decodifica todos os blocos de uma atualização e só então desenha,
+            // para não mostrar a tela pela metade
+            async function paint(msg) {
+                const view = new DataView(msg.buffer, msg.byteOffset, msg.byteLength);
+                const width = view.getUint16(0), height = view.getUint16(2);
+                const count = view.getUint16(4);
+                if (canvas.width !== width || canvas.height !== height) {
+                    canvas.width = width;
+                    canvas.height = height;
+                }
+                let offset = 6;
+                const pending = [];
+                for (let i = 0; i < count; i++) {
+                    const x = view.getUint16(offset), y = view.getUint16(offset + 2);
+                    const size = view.getUint32(offset + 8);
+                    offset += 12;
+                    const blob = new Blob([msg.subarray(offset, offset + size)], {type: 'image/jpeg'});
+                    offset += size;
+                    pending.push(createImageBitmap(blob).then(bitmap => ({x, y, bitmap})));
+                }
+                for (const tile of await Promise.all(pending)) {
+                    ctx.drawImage(tile.bitmap, tile.x, tile.y);
+                    tile.bitmap.close();
+                }
+            }
+            
+            async function connect() {
+                try {
+                    // /tiles?layout=strips usa faixas codificadas em paralelo no lugar dos blocos
+                    const layout = new URLSearchParams(window.location.search).get('layout') || 'tiles';
+                    const response = await fetch('/tiles_feed?layout=' + layout + '&t=' + new Date().getTime());
+                    const reader = response.body.getReader();
+                    let buffer = new Uint8Array(0);
+                    setStatus('Conectado', 'rgba(0,255,0,0.5)');
+                    errorCount = 0;
+                    
+                    while (true) {
+                        const {value, done} = await reader.read();
+                        if (done) break;
+                        const merged = new Uint8Array(buffer.length + value.length);
+                        merged.set(buffer);
+                        merged.set(value, buffer.length);
+                        buffer = merged;
+                        
+                        // Cada mensagem começa com seu tamanho em 4 bytes
+                        while (buffer.length >= 4) {
+                            const size = new DataView(buffer.buffer, buffer.byteOffset).getUint32(0);
+                            if (buffer.length < 4 + size) break;
+                            await paint(buffer.subarray(4, 4 + size));
+                            buffer = buffer.slice(4 + size);
+                        }
+                    }
+                } catch (e) {
+                    console.log(e);
+                }
+                
+                errorCount++;
+                setStatus('Erro na conexão!', 'rgba(255,0,0,0.5)');
+                if (errorCount < 5) {
+                    setTimeout(connect, 1000);
+                }
             }
+            
+            connect();
         </script>
     </body>
     </html>
     """
 
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WS_TEXT, WS_BINARY, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+# Cabeçalho de cada frame no WebSocket: u32 id (usado no ack), f64 momento da captura
+WS_FRAME_HEADER = struct.Struct('>Id')
+
+def websocket_accept(key):
+    """Valor do Sec-WebSocket-Accept para a chave do cliente (RFC 6455)"""
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+
+def ws_header(opcode, length):
+    """Cabeçalho de uma mensagem do servidor (sem máscara, sem fragmentação)"""
+    first = 0x80 | opcode
+    if length < 126:
+        return struct.pack('>BB', first, length)
+    if length < 65536:
+        return struct.pack('>BBH', first, 126, length)
+    return struct.pack('>BBQ', first, 127, length)
+
+def ws_unmask(payload, mask):
+    repeated = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(len(payload), 'big')
+
+async def read_ws_message(reader, limit=WS_MAX_MESSAGE):
+    """Lê uma mensagem do cliente, juntando fragmentos; retorna (opcode, dados)"""
+    opcode = None
+    message = bytearray()
+    while True:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('>H', await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('>Q', await reader.readexactly(8))[0]
+        if length > limit:
+            raise ConnectionError("Mensagem WebSocket grande demais")
+        mask = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+        if mask and payload:
+            payload = ws_unmask(payload, mask)
+        if first & 0x0F >= WS_CLOSE:
+            # Mensagens de controle podem chegar entre os fragmentos
+            return first & 0x0F, payload
+        opcode = opcode or first & 0x0F
+        message += payload
+        if len(message) > limit:
+            raise ConnectionError("Mensagem WebSocket grande demais")
+        if first & 0x80:
+            return opcode, bytes(message)
+
+def parse_headers(head):
+    """Cabeçalhos de uma requisição HTTP, com nomes em minúsculas"""
+    headers = {}
+    for line in head.decode('latin-1').split('\r\n')[1:]:
+        name, _, value = line.partition(':')
+        if name:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+class AsyncStreamServer:
+    """Servidor HTTP mínimo em asyncio para muitos espectadores: uma corrotina
+    por conexão em vez de uma thread, escrita não bloqueante com backpressure
+    por conexão e limite de admissão"""
+    
+    def __init__(self, host='0.0.0.0', port=5000, max_clients=MAX_CLIENTS):
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.clients = 0
+        self.loop = None
+        self.stopped = None
+        # Long-polls do /snapshot.jpg bloqueiam uma thread cada; ficam fora do
+        # executor padrão, usado na codificação de variantes
+        self.snapshot_executor = ThreadPoolExecutor(SNAPSHOT_WORKERS, thread_name_prefix='snapshot')
+    
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        async with server:
+            await self.stopped.wait()
+    
+    async def respond(self, writer, status, body, content_type='text/plain; charset=utf-8', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        extra = ''.join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n{extra}"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('ascii'))
+        writer.write(body)
+        await writer.drain()
+    
+    async def handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10)
+            method, target = head.split(b'\r\n', 1)[0].decode('latin-1').split(' ')[:2]
+            url = urlsplit(target)
+            args = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            parts = url.path.strip('/').split('/')
+            
+            if method != 'GET':
+                await self.respond(writer, '405 Method Not Allowed', 'Método não permitido')
+            elif url.path == '/video_feed':
+                await self.stream(writer, args)
+            elif len(parts) == 2 and parts[0] == 'video_feed' and parts[1].isdigit():
+                if valid_monitor(int(parts[1])):
+                    await self.stream(writer, args, int(parts[1]))
+                else:
+                    await self.respond(writer, '404 Not Found', 'Monitor não encontrado')
+            elif url.path == '/ws':
+                await self.websocket(reader, writer, args, parse_headers(head))
+            elif len(parts) == 2 and parts[0] == 'ws' and parts[1].isdigit():
+                if valid_monitor(int(parts[1])):
+                    await self.websocket(reader, writer, args, parse_headers(head), int(parts[1]))
+                else:
+                    await self.respond(writer, '404 Not Found', 'Monitor não encontrado')
+            elif len(parts) == 2 and parts[0] == 'monitor' and parts[1].isdigit():
+                await self.respond(writer, '200 OK', set_monitor(int(parts[1])))
+            elif url.path == '/snapshot.jpg':
+                status, headers, body = await self.loop.run_in_executor(
+                    self.snapshot_executor, snapshot, args, parse_headers(head).get('if-none-match'))
+                await self.respond(writer, status, body, headers.pop('Content-Type', 'image/jpeg'), headers)
+            elif url.path == '/metrics':
+                await self.respond(writer, '200 OK', render_metrics_text(), 'text/plain; version=0.0.4')
+            elif url.path == '/metrics.json':
+                await self.respond(writer, '200 OK', json.dumps(metrics_snapshot()), 'application/json')
+            elif url.path == '/shutdown':
+                await self.respond(writer, '200 OK', shutdown())
+                self.stopped.set()
+            elif url.path == '/':
+                await self.respond(writer, '200 OK', index(), 'text/html; charset=utf-8')
+            else:
+                await self.respond(writer, '404 Not Found', 'Não encontrado')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Erro na conexão: {e}")
+        finally:
+            writer.close()
+    
+    async def admit(self, writer, args, monitor, event):
+        """Cria o StreamClient de uma conexão de vídeo, ou responde com o erro
+        (limite de espectadores, região inválida) e retorna None"""
+        if self.clients >= self.max_clients:
+            await self.respond(writer, '503 Service Unavailable', 'Limite de espectadores atingido')
+            return None
+        try:
+            region = parse_region(args)
+        except (ValueError, KeyError, TypeError) as e:
+            await self.respond(writer, '400 Bad Request', f'Região inválida: {e}')
+            return None
+        
+        fps = int(args['fps']) if args.get('fps', '').isdigit() else None
+        if fps:
+            fps = clamp_fps(fps)
+        # O produtor roda em outra thread: cada frame publicado acorda esta conexão
+        notify = lambda: self.loop.call_soon_threadsafe(event.set)
+        peer = writer.get_extra_info('peername')
+        client = StreamClient(fps, args.get('adaptive', '1') != '0', parse_viewport(args), notify,
+                              peer[0] if peer else None, monitor, region, args.get('tier'))
+        self.clients += 1
+        return client
+    
+    async def next_item(self, client, event):
+        """Espera o ritmo do cliente e o próximo frame do slot (None no keepalive)"""
+        delay = client.pace_delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        event.clear()
+        item = client.slot.poll()
+        if item is None:
+            try:
+                await asyncio.wait_for(event.wait(), client.wait_timeout())
+            except asyncio.TimeoutError:
+                pass
+            item = client.slot.poll()
+        return item
+    
+    async def frame_data(self, frame, variant):
+        data = frame.variants.get(variant)
+        if data is None:
+            # Codificação de variante fora do loop de eventos
+            data = await self.loop.run_in_executor(None, frame.encode, *variant)
+        return data
+    
+    async def stream(self, writer, args, monitor=None):
+        new_frame = asyncio.Event()
+        client = await self.admit(writer, args, monitor, new_frame)
+        if client is None:
+            return
+        
+        try:
+            # drain() espera o frame inteiro sair do buffer do transporte; os frames
+            # que chegarem nesse meio tempo substituem o pendente no slot
+            writer.transport.set_write_buffer_limits(high=0)
+            limit_send_buffer(writer.get_extra_info('socket'))
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: multipart/x-mixed-replace; boundary=frame\r\n'
+                         b'Cache-Control: no-cache\r\nConnection: close\r\n\r\n')
+            
+            while not should_stop:
+                client.follow_monitor()
+                job = client.select(await self.next_item(client, new_frame))
+                if job is None:
+                    continue
+                frame, variant = job
+                data = await self.frame_data(frame, variant)
+                
+                start = time.perf_counter()
+                writer.writelines(mjpeg_part(data, frame.timestamp))
+                await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+                client.sent(time.perf_counter() - start)
+        finally:
+            self.clients -= 1
+            client.close()
+    
+    async def websocket(self, reader, writer, args, headers, monitor=None):
+        """Vídeo por WebSocket: cada frame vai como mensagem binária e a página
+        confirma depois de desenhá-lo. Com no máximo WS_WINDOW frames sem
+        confirmação, o FPS acompanha a velocidade real de decodificação do aparelho."""
+        key = headers.get('sec-websocket-key')
+        if 'websocket' not in headers.get('upgrade', '').lower() or not key:
+            await self.respond(writer, '400 Bad Request', 'Esperada uma conexão WebSocket')
+            return
+        wake = asyncio.Event()
+        client = await self.admit(writer, args, monitor, wake)
+        if client is None:
+            return
+        
+        # id do frame -> (início do envio, era keepalive)
+        in_flight = {}
+        receiver = None
+        try:
+            writer.transport.set_write_buffer_limits(high=0)
+            limit_send_buffer(writer.get_extra_info('socket'))
+            writer.write(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                         b'Sec-WebSocket-Accept: ' + websocket_accept(key).encode('ascii') + b'\r\n\r\n')
+            receiver = asyncio.create_task(self.ws_receive(reader, writer, client, in_flight, wake))
+            frame_ids = itertools.count(1)
+            
+            while not should_stop and not receiver.done():
+                client.follow_monitor()
+                if len(in_flight) >= WS_WINDOW:
+                    # Janela cheia: nada é enviado até chegar um ack; enquanto isso
+                    # frames mais novos substituem o pendente no slot
+                    waited = time.perf_counter() - min(start for start, _ in in_flight.values())
+                    if waited >= SEND_TIMEOUT:
+                        break
+                    wake.clear()
+                    try:
+                        await asyncio.wait_for(wake.wait(), SEND_TIMEOUT - waited)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                
+                job = client.select(await self.next_item(client, wake))
+                if job is None:
+                    continue
+                frame, variant = job
+                data = await self.frame_data(frame, variant)
+                
+                frame_id = next(frame_ids) & 0xFFFFFFFF
+                in_flight[frame_id] = (time.perf_counter(), client.keepalive)
+                writer.writelines((ws_header(WS_BINARY, WS_FRAME_HEADER.size + len(data)),
+                                   WS_FRAME_HEADER.pack(frame_id, frame.timestamp), data))
+                await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+            
+            if not writer.is_closing():
+                writer.write(ws_header(WS_CLOSE, 2) + struct.pack('>H', 1000))
+        finally:
+            if receiver:
+                receiver.cancel()
+            self.clients -= 1
+            client.close()
+    
+    async def ws_receive(self, reader, writer, client, in_flight, wake):
+        """Mensagens da página: acks dos frames desenhados e mudanças de viewport"""
+        try:
+            while True:
+                opcode, payload = await read_ws_message(reader)
+                if opcode == WS_CLOSE:
+                    return
+                if opcode == WS_PING:
+                    writer.write(ws_header(WS_PONG, len(payload)) + payload)
+                    continue
+                if opcode != WS_TEXT:
+                    continue
+                
+                message = json.loads(payload)
+                sent = in_flight.pop(message.get('ack'), None)
+                if sent:
+                    # Com WS_WINDOW frames em trânsito, cada frame custa ~1/WS_WINDOW do
+                    # tempo até o ack (rede + decodificação + desenho)
+                    client.keepalive = sent[1]
+                    client.sent((time.perf_counter() - sent[0]) / WS_WINDOW)
+                    # Abriu espaço na janela: o envio não pode esperar por um frame
+                    # novo, porque com a tela parada o pendente no slot é o último
+                    wake.set()
+                if 'viewport' in message:
+                    # A página mudou de tamanho: próximas variantes seguem a nova viewport
+                    width, height, dpr = message['viewport']
+                    client.viewport = parse_viewport({'w': width, 'h': height, 'dpr': dpr})
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, TypeError, AttributeError):
+            pass
+        finally:
+            wake.set()
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor de segunda tela")
+    parser.add_argument('--fps', type=int, default=TARGET_FPS, help="FPS alvo do streaming")
+    parser.add_argument('--server', choices=['flask', 'async'], default='flask',
+                        help="flask: servidor de desenvolvimento; async: servidor asyncio para muitos espectadores")
+    parser.add_argument('--max-clients', type=int, default=MAX_CLIENTS,
+                        help="Limite de espectadores simultâneos no modo async")
+    parser.add_argument('--source', choices=('mss',) + synthetic_screen.SOURCES, default=CAPTURE_SOURCE,
+                        help="Fonte de captura; as sintéticas dispensam monitor (benchmarks e testes de carga)")
+    parser.add_argument('--resolution', default='1920x1080', help="Resolução das fontes sintéticas")
+    parser.add_argument('--host', default='0.0.0.0', help="Endereço de escuta")
+    parser.add_argument('--port', type=int, default=5000, help="Porta HTTP")
+    parser.add_argument('--simulcast', action=argparse.BooleanOptionalAction, default=SIMULCAST,
+                        help="Camadas fixas de qualidade compartilhadas entre os espectadores")
+    parser.add_argument('--encoder', choices=('auto',) + tuple(ENCODER_BACKENDS), default=JPEG_ENCODER,
+                        help="Codificador JPEG; auto escolhe o mais rápido disponível")
+    parser.add_argument('--subsampling', choices=SUBSAMPLINGS, default=JPEG_SUBSAMPLING,
+                        help="Subamostragem de cor do JPEG")
+    parser.add_argument('--jpeg-optimize', action='store_true', help="Tabelas Huffman otimizadas")
+    parser.add_argument('--jpeg-progressive', action='store_true', help="JPEG progressivo")
+    parser.add_argument('--ws-port', type=int, default=None,
+                        help="Porta do WebSocket no modo Flask (padrão: porta HTTP + 1; 0 desativa)")
+    args = parser.parse_args()
+    TARGET_FPS = clamp_fps(args.fps)
+    CAPTURE_SOURCE = args.source
+    SYNTHETIC_RESOLUTION = tuple(int(value) for value in args.resolution.lower().split('x'))
+    SIMULCAST = args.simulcast
+    select_encoder(args.encoder, args.subsampling, args.jpeg_optimize, args.jpeg_progressive)
+    
     ip = get_local_ip()
-    logger.info(f"Iniciando servidor em http://{ip}:5000")
+    logger.info(f"Iniciando servidor em http://{ip}:{args.port}")
     logger.info("Pressione Ctrl+C para encerrar")
     
     try:
-        if init_screen_capture():
-            app.run(host='0.0.0.0', port=5000, debug=True)
-        else:
+        if not init_screen_capture():
             logger.error("Não foi possível inicializar a captura de tela")
+        elif args.server == 'async':
+            asyncio.run(AsyncStreamServer(args.host, args.port, args.max_clients).serve())
+        else:
+            # O servidor de desenvolvimento do Flask não aceita WebSocket: um
+            # AsyncStreamServer auxiliar atende o /ws em outra porta
+            ws_port = args.port + 1 if args.ws_port is None else args.ws_port
+            if ws_port:
+                WEBSOCKET_PORT = ws_port
+                # Com o reloader, só o processo filho (o que atende) inicia o auxiliar
+                if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+                    sidecar = AsyncStreamServer(args.host, ws_port, args.max_clients)
+                    threading.Thread(target=lambda: asyncio.run(sidecar.serve()), daemon=True,
+                                     name='websocket').start()
+                    logger.info(f"WebSocket em ws://{ip}:{ws_port}/ws")
+            app.run(host=args.host, port=args.port, debug=True)
     except Exception as e:
         logger.error(f"Erro ao iniciar servidor: {e}")
     finally:
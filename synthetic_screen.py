@@ -0,0 +1,101 @@
+"""
+Telas sintéticas que substituem o mss.mss() em benchmarks e testes de carga,
+permitindo medir a captura/codificação em máquinas Linux sem monitor
+"""
+
+from PIL import Image, ImageDraw
+
+# Tipos de conteúdo disponíveis
+SOURCES = ('static', 'scroll', 'motion')
+
+class SyntheticShot:
+    """Imita o ScreenShot do mss: pixels BGRA em um bytearray novo a cada captura"""
+
+    def __init__(self, raw, size):
+        self.raw = raw
+        self.size = size
+        self.width, self.height = size
+
+    @property
+    def bgra(self):
+        return bytes(self.raw)
+
+    @property
+    def rgb(self):
+        return Image.frombuffer('RGB', self.size, self.raw, 'raw', 'BGRX', 0, 1).tobytes()
+
+class SyntheticScreen:
+    """Substituto do mss.mss() com conteúdo gerado.
+
+    - static: a mesma imagem em todas as capturas
+    - scroll: texto rolando alguns pixels por frame (conteúdo de escritório)
+    - motion: todos os pixels mudam a cada frame (vídeo/jogo)
+    """
+
+    def __init__(self, kind='static', width=1920, height=1080):
+        if kind not in SOURCES:
+            raise ValueError(f"Fonte sintética desconhecida: {kind}")
+        self.kind = kind
+        self.width = width
+        self.height = height
+        self.frame_number = 0
+        monitor = {'left': 0, 'top': 0, 'width': width, 'height': height}
+        # Como no mss: índice 0 é a área de todos os monitores, 1 é o primeiro monitor
+        self.monitors = [dict(monitor), dict(monitor, name='Monitor sintético')]
+
+        # O conteúdo é gerado uma vez com o dobro da altura; cada captura é uma
+        # janela deslizando sobre ele, então gerar um frame custa só uma cópia
+        if kind == 'scroll':
+            canvas = self._text_canvas()
+            self.step = 3
+        elif kind == 'motion':
+            canvas = self._motion_canvas()
+            self.step = 37
+        else:
+            canvas = self._text_canvas()
+            self.step = 0
+        self.stride = width * 4
+        self.canvas = canvas.convert('RGBX').tobytes('raw', 'BGRX')
+
+    def _text_canvas(self):
+        img = Image.new('RGB', (self.width, self.height * 2), 'white')
+        draw = ImageDraw.Draw(img)
+        line = "Relatorio trimestral - vendas, custos e metas por regiao 0123456789 "
+        repeat = max(1, self.width // 700)
+        for number, top in enumerate(range(40, self.height * 2, 22)):
+            if number % 8 == 7:
+                continue  # linha em branco entre parágrafos
+            color = (30, 30, 30) if number % 8 else (20, 60, 160)
+            draw.text((60, top), f"{number:05d} " + line * repeat, fill=color)
+        return img
+
+    def _motion_canvas(self):
+        size = (self.width, self.height * 2)
+        fractal = Image.effect_mandelbrot(size, (-2.2, -1.4, 1.0, 1.4), 64)
+        noise = Image.effect_noise(size, 48)
+        return Image.merge('RGB', (fractal, noise, Image.linear_gradient('L').resize(size)))
+
+    def grab(self, monitor):
+        """Retorna a região pedida do frame atual (dict com left/top/width/height)"""
+        offset = (self.frame_number * self.step) % self.height
+        self.frame_number += 1
+
+        left = monitor.get('left', 0)
+        top = monitor.get('top', 0) + offset
+        width = min(monitor.get('width', self.width), self.width - left)
+        height = min(monitor.get('height', self.height), self.height - monitor.get('top', 0))
+
+        if left == 0 and width == self.width:
+            # Linhas inteiras são contíguas no buffer
+            raw = bytearray(memoryview(self.canvas)[top * self.stride:(top + height) * self.stride])
+        else:
+            start = left * 4
+            end = start + width * 4
+            canvas = memoryview(self.canvas)
+            raw = bytearray(b''.join(
+                canvas[row * self.stride + start:row * self.stride + end]
+                for row in range(top, top + height)))
+        return SyntheticShot(raw, (width, height))
+
+    def close(self):
+        pass
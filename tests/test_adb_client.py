@@ -0,0 +1,215 @@
+"""
+Cliente ADB nativo contra um servidor ADB falso local: enquadramento dos
+pedidos, shell v1/v2 e serviço sync com sessões reaproveitadas
+"""
+
+import os
+import socket
+import struct
+import threading
+
+import pytest
+
+from adb_client import ADBClient, ADBError, EXIT_MARKER
+
+SERIAL = 'emulator-5554'
+
+
+class FakeADBServer:
+    """Servidor ADB mínimo: serviços de host, transport, shell e sync"""
+
+    def __init__(self, shell_v2=True):
+        self.shell_v2 = shell_v2
+        self.files = {}  # caminho no aparelho -> (modo, conteúdo)
+        self.raw_requests = []  # pedidos como chegaram (tamanho hexadecimal + serviço)
+        self.sync_sessions = 0
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+    def close(self):
+        self.sock.close()
+
+    def read(self, connection, size):
+        data = b''
+        while len(data) < size:
+            chunk = connection.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def request(self, connection):
+        prefix = self.read(connection, 4)
+        service = self.read(connection, int(prefix, 16))
+        self.raw_requests.append(prefix + service)
+        return service.decode()
+
+    def reply(self, connection, text=None):
+        data = b'' if text is None else b'%04x' % len(text) + text.encode()
+        connection.sendall(b'OKAY' + data)
+
+    def fail(self, connection, text):
+        connection.sendall(b'FAIL' + b'%04x' % len(text) + text.encode())
+
+    def run(self, command):
+        if command.startswith('echo '):
+            return command[5:] + '\n', '', 0
+        if command == 'false':
+            return '', 'erro\n', 1
+        return '', f'/system/bin/sh: {command}: not found\n', 127
+
+    def handle(self, connection):
+        try:
+            while True:
+                service = self.request(connection)
+                if service == 'host:version':
+                    return self.reply(connection, '0029')
+                if service == 'host:devices':
+                    return self.reply(connection, f'{SERIAL}\tdevice\n')
+                if service.startswith(('host-serial:', 'host:transport:')):
+                    serial = service[15:] if service.startswith('host:transport:') else service.split(':')[1]
+                    if serial != SERIAL:
+                        return self.fail(connection, f"device '{serial}' not found")
+                if service == f'host-serial:{SERIAL}:features':
+                    return self.reply(connection, 'shell_v2,cmd' if self.shell_v2 else 'cmd')
+                if service == f'host:transport:{SERIAL}':
+                    self.reply(connection)
+                    continue
+                if service.startswith('shell,v2,raw:'):
+                    stdout, stderr, code = self.run(service[13:])
+                    self.reply(connection)
+                    for kind, data in ((1, stdout.encode()), (2, stderr.encode())):
+                        if data:
+                            connection.sendall(struct.pack('<BI', kind, len(data)) + data)
+                    return connection.sendall(struct.pack('<BI', 3, 1) + bytes([code]))
+                if service.startswith('shell:'):
+                    command, _, marker = service[6:].partition('; echo "')
+                    stdout, stderr, code = self.run(command)
+                    self.reply(connection)
+                    output = stdout + stderr + (marker.replace('$?"', str(code)) + '\n' if marker else '')
+                    return connection.sendall(output.encode())
+                if service == 'sync:':
+                    self.sync_sessions += 1
+                    self.reply(connection)
+                    return self.sync(connection)
+                return self.fail(connection, f'unknown service {service}')
+        except (EOFError, OSError):
+            pass
+        finally:
+            connection.close()
+
+    def sync(self, connection):
+        while True:
+            command = self.read(connection, 4)
+            size = struct.unpack('<I', self.read(connection, 4))[0]
+            if command == b'QUIT':
+                return
+            path = self.read(connection, size).decode()
+            if command == b'STAT':
+                mode, data = self.files.get(path, (0, b''))
+                connection.sendall(b'STAT' + struct.pack('<III', mode, len(data), 0))
+            elif command == b'SEND':
+                path, mode = path.rsplit(',', 1)
+                data = b''
+                while True:
+                    chunk_id = self.read(connection, 4)
+                    chunk_size = struct.unpack('<I', self.read(connection, 4))[0]
+                    if chunk_id == b'DONE':
+                        break
+                    assert chunk_id == b'DATA'
+                    data += self.read(connection, chunk_size)
+                self.files[path] = (0o100000 | int(mode), data)
+                connection.sendall(b'OKAY' + struct.pack('<I', 0))
+            elif command == b'RECV':
+                if path not in self.files:
+                    message = b'No such file or directory'
+                    connection.sendall(b'FAIL' + struct.pack('<I', len(message)) + message)
+                    continue
+                data = self.files[path][1]
+                for start in range(0, len(data), 65536):
+                    chunk = data[start:start + 65536]
+                    connection.sendall(b'DATA' + struct.pack('<I', len(chunk)) + chunk)
+                connection.sendall(b'DONE' + struct.pack('<I', 0))
+
+
+@pytest.fixture
+def server():
+    server = FakeADBServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client(server):
+    client = ADBClient(port=server.port, timeout=5)
+    yield client
+    client.close()
+
+
+def test_requests_use_hex_length_prefix(server, client):
+    assert client.version() == 0x29
+    assert client.devices() == [(SERIAL, 'device')]
+    assert server.raw_requests[:2] == [b'000chost:version', b'000chost:devices']
+
+
+def test_shell_v2_separates_streams_and_exit_code(client):
+    result = client.shell(SERIAL, 'echo ok')
+    assert (result.returncode, result.stdout, result.stderr) == (0, 'ok\n', '')
+    result = client.shell(SERIAL, 'false')
+    assert (result.returncode, result.stdout, result.stderr) == (1, '', 'erro\n')
+
+
+def test_shell_v1_reads_exit_code_from_marker(server, client):
+    server.shell_v2 = False
+    result = client.shell(SERIAL, 'echo ok')
+    assert (result.returncode, result.stdout) == (0, 'ok\n')
+    assert client.shell(SERIAL, 'missing').returncode == 127
+    assert any(EXIT_MARKER.encode() in request for request in server.raw_requests)
+
+
+def test_unknown_device_raises_server_message(client):
+    with pytest.raises(ADBError, match="device 'other' not found"):
+        client.shell('other', 'echo ok')
+
+
+def test_sync_round_trip_reuses_session(server, client, tmp_path):
+    # Maior que um bloco DATA, para conferir a divisão em vários blocos
+    payload = os.urandom(150 * 1024)
+    local = tmp_path / 'local.bin'
+    local.write_bytes(payload)
+
+    assert client.push(SERIAL, str(local), '/sdcard/file.bin') == len(payload)
+    stat = client.stat(SERIAL, '/sdcard/file.bin')
+    assert stat.exists and stat.size == len(payload) and stat.mode == 0o100644
+    assert not client.stat(SERIAL, '/sdcard/missing').exists
+
+    copy = tmp_path / 'copy.bin'
+    assert client.pull(SERIAL, '/sdcard/file.bin', str(copy)) == len(payload)
+    assert copy.read_bytes() == payload
+    assert server.sync_sessions == 1
+
+
+def test_sync_fail_discards_session(server, client, tmp_path):
+    server.files['/sdcard/file.txt'] = (0o100644, b'conteudo')
+    local = tmp_path / 'missing.txt'
+
+    with pytest.raises(ADBError, match='No such file'):
+        client.pull(SERIAL, '/sdcard/missing.txt', str(local))
+    assert not os.path.exists(str(local) + '.part')
+    assert not os.path.exists(local)
+
+    # A sessão que recebeu FAIL não volta para o pool; a próxima transferência abre outra
+    assert client.pull(SERIAL, '/sdcard/file.txt', str(local)) == len(b'conteudo')
+    assert local.read_bytes() == b'conteudo'
+    assert server.sync_sessions == 2
@@ -0,0 +1,27 @@
+"""
+Leitura das propriedades do aparelho (DeviceInfo.parse)
+"""
+
+import pytest
+
+from adb_utils import DISPLAY_MARKER, DeviceInfo
+
+OUTPUT = '\n'.join([
+    '[ro.build.version.release]: [6.0.1]',
+    '[ro.build.version.sdk]: [23]',
+    '[ro.product.brand]: [samsung]',
+    '[ro.product.model]: [SM-G920F]',
+    DISPLAY_MARKER,
+    'Physical size: 1440x2560',
+    'Physical density: 640',
+    ''
+])
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'], ids=['lf', 'crlf'])
+def test_parse_device_info(newline):
+    info = DeviceInfo.parse('serial', OUTPUT.replace('\n', newline))
+    assert (info.model, info.brand, info.version, info.sdk) == ('SM-G920F', 'samsung', '6.0.1', '23')
+    assert info.resolution == '1440x2560'
+    assert info.density == 640
+    assert info.properties['ro.product.model'] == 'SM-G920F'
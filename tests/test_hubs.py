@@ -0,0 +1,74 @@
+"""
+Ciclo de vida dos produtores compartilhados (FrameHub)
+"""
+
+import threading
+import time
+
+import pytest
+
+import screen_server
+
+
+@pytest.fixture
+def synthetic(monkeypatch):
+    monkeypatch.setattr(screen_server, 'CAPTURE_SOURCE', 'scroll')
+    monkeypatch.setattr(screen_server, 'SYNTHETIC_RESOLUTION', (320, 240))
+    monkeypatch.setattr(screen_server, 'REGION_HUB_LINGER', 0.3)
+    monkeypatch.setattr(screen_server, 'ENCODE_WORKERS', 2)
+    screen_server.hubs.clear()
+    yield
+    screen_server.hubs.clear()
+
+
+def producer_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith('captura-monitor-')]
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def test_idle_region_hubs_are_removed(synthetic):
+    before = len(producer_threads())
+    for size in range(20, 40):
+        hub = screen_server.get_hub(1, region=(0, 0, size, size))
+        hub.subscribe()
+        seq, frame = hub.wait_frame(0, timeout=5)
+        assert frame is not None
+        hub.unsubscribe()
+
+    assert wait_until(lambda: not screen_server.hubs)
+    assert wait_until(lambda: len(producer_threads()) == before)
+
+
+def test_region_hub_restarts_after_retiring(synthetic):
+    region = (0, 0, 64, 64)
+    hub = screen_server.get_hub(1, region=region)
+    hub.subscribe()
+    assert hub.wait_frame(0, timeout=5)[1] is not None
+    hub.unsubscribe()
+    assert wait_until(lambda: hub.thread is None)
+
+    # Quem ainda tinha a referência (ou pede a mesma região de novo) volta a receber frames
+    again = screen_server.get_hub(1, region=region)
+    again.subscribe()
+    try:
+        seq, frame = again.wait_frame(again.seq, timeout=5)
+        assert frame is not None
+    finally:
+        again.unsubscribe()
+
+
+def test_whole_monitor_hub_stays_registered(synthetic):
+    hub = screen_server.get_hub(1)
+    hub.subscribe()
+    hub.wait_frame(0, timeout=5)
+    hub.unsubscribe()
+    time.sleep(0.6)
+    assert screen_server.hubs.get((1, 'mjpeg', None)) is hub
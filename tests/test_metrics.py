@@ -0,0 +1,58 @@
+"""
+Exportação das métricas (/metrics e /metrics.json)
+"""
+
+import pytest
+
+import screen_server
+
+
+@pytest.fixture
+def region_hub():
+    screen_server.hubs.clear()
+    hub = screen_server.get_hub(1, region=(0, 0, 100, 100))
+    yield hub
+    screen_server.hubs.clear()
+
+
+def test_metrics_with_region_producer(region_hub):
+    client = screen_server.app.test_client()
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert 'screen_server_target_fps{monitor="1",mode="mjpeg",region="0,0,100,100"}' in text
+
+    response = client.get('/metrics.json')
+    assert response.status_code == 200
+    assert '1:mjpeg:0,0,100,100' in response.get_json()['producers']
+
+
+def test_histogram_counters_survive_the_window(monkeypatch):
+    monkeypatch.setattr(screen_server, 'metrics', screen_server.Metrics())
+    samples = screen_server.METRICS_WINDOW + 100
+    for _ in range(samples):
+        screen_server.metrics.observe('test_ms', 3)
+
+    # A janela limita os percentis, mas _count, _sum e os buckets seguem acumulando
+    assert screen_server.metrics.histogram('test_ms').snapshot()['count'] == screen_server.METRICS_WINDOW
+    text = screen_server.render_metrics_text()
+    assert f'screen_server_test_ms_count {samples}' in text
+    assert f'screen_server_test_ms_sum {samples * 3}' in text
+    assert 'screen_server_test_ms_bucket{le="2"} 0' in text
+    assert f'screen_server_test_ms_bucket{{le="5"}} {samples}' in text
+    assert f'screen_server_test_ms_bucket{{le="+Inf"}} {samples}' in text
+
+
+def test_histogram_type_written_once_per_metric(monkeypatch):
+    monkeypatch.setattr(screen_server, 'metrics', screen_server.Metrics())
+    screen_server.metrics.observe('capture_ms', 4, monitor=0)
+    screen_server.metrics.observe('capture_ms', 6, monitor=1)
+
+    lines = screen_server.render_metrics_text().splitlines()
+    assert lines.count('# TYPE screen_server_capture_ms histogram') == 1
+    assert 'screen_server_capture_ms_count{monitor="0"} 1' in lines
+    assert 'screen_server_capture_ms_count{monitor="1"} 1' in lines
+    # As amostras de cada métrica seguem o seu # TYPE, sem intercalar outras métricas
+    start = lines.index('# TYPE screen_server_capture_ms histogram')
+    samples = [i for i, line in enumerate(lines) if line.startswith('screen_server_capture_ms')]
+    assert samples == list(range(start + 1, start + 1 + len(samples)))
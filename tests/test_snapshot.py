@@ -0,0 +1,63 @@
+"""
+/snapshot.jpg: ETag, 304 e long-poll
+"""
+
+import time
+
+import pytest
+
+import screen_server
+
+
+@pytest.fixture
+def static_screen(monkeypatch):
+    monkeypatch.setattr(screen_server, 'CAPTURE_SOURCE', 'static')
+    monkeypatch.setattr(screen_server, 'SYNTHETIC_RESOLUTION', (320, 240))
+    monkeypatch.setattr(screen_server, 'SNAPSHOT_LINGER', 0.2)
+    screen_server.hubs.clear()
+    yield
+    screen_server.hubs.clear()
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def test_unchanged_screen_revalidates_after_capture_pause(static_screen):
+    status, headers, body = screen_server.snapshot({'monitor': '1'})
+    assert status == '200 OK'
+    assert body.startswith(b'\xff\xd8')
+    etag = headers['ETag']
+
+    # Sem pedidos a captura pausa e descarta o frame; o próximo poll recomeça a captura
+    hub = screen_server.get_hub(1)
+    assert wait_until(lambda: hub.subscribers == 0 and hub.frame is None)
+
+    status, headers, body = screen_server.snapshot({'monitor': '1'}, etag)
+    assert status == '304 Not Modified'
+    assert headers['ETag'] == etag
+    assert body == b''
+
+
+def test_snapshot_hold_pre_encodes_the_served_tier(monkeypatch, static_screen):
+    monkeypatch.setattr(screen_server, 'CAPTURE_SOURCE', 'scroll')
+    monkeypatch.setattr(screen_server, 'SIMULCAST', True)
+    tier = screen_server.tier_index('medium')
+
+    status, headers, body = screen_server.snapshot({'monitor': '1', 'tier': 'medium'})
+    assert status == '200 OK'
+    hub = screen_server.get_hub(1)
+    assert hub.active_tiers() == [tier]
+
+    # Frames publicados durante a reserva já trazem a variante servida, e só ela
+    seq, frame = hub.wait_frame(hub.seq, timeout=5)
+    assert frame is not None
+    assert list(frame.variants) == [screen_server.tier_variant(frame.size, tier)]
+
+    assert wait_until(lambda: hub.subscribers == 0)
+    assert hub.active_tiers() == []
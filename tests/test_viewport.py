@@ -0,0 +1,28 @@
+"""
+Viewport informada pelo cliente (/video_feed?w=..&h=..&dpr=.. e mensagem viewport do WebSocket)
+"""
+
+import pytest
+
+import screen_server
+
+
+@pytest.mark.parametrize('args', [
+    {'w': '800', 'h': '600', 'dpr': '0'},
+    {'w': '800', 'h': '600', 'dpr': '-1'},
+    {'w': '800', 'h': '600', 'dpr': 'nan'},
+    {'w': '800', 'h': '600', 'dpr': 'inf'},
+    {'w': '-800', 'h': '600'},
+    {'w': '800', 'h': '-600'},
+    {'w': float('inf'), 'h': 600, 'dpr': 1},
+    {'w': None, 'h': 600, 'dpr': 1},
+    {'w': 'abc', 'h': '600'},
+])
+def test_invalid_viewport_falls_back_to_full_size(args):
+    assert screen_server.parse_viewport(args) is None
+
+
+def test_valid_viewport_scales_down():
+    viewport = screen_server.parse_viewport({'w': '960', 'h': '540', 'dpr': '1'})
+    assert viewport == (960, 540, 1.0)
+    assert screen_server.fit_size((1920, 1080), *viewport) == (960, 540)
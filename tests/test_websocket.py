@@ -0,0 +1,95 @@
+"""
+Transporte WebSocket do servidor asyncio: controle de fluxo pela janela de acks
+"""
+
+import asyncio
+import json
+import socket
+
+import pytest
+
+import screen_server
+import synthetic_screen
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def frozen_screen(monkeypatch):
+    """Tela sintética rolando até freeze() ser chamado; depois disso todas as
+    capturas são iguais e o produtor não publica mais nada"""
+    state = {'frozen_at': None}
+    grab = synthetic_screen.SyntheticScreen.grab
+
+    def frozen_grab(self, monitor):
+        if state['frozen_at'] is not None:
+            self.frame_number = state['frozen_at']
+        return grab(self, monitor)
+
+    def freeze():
+        state['frozen_at'] = 10 ** 6
+
+    monkeypatch.setattr(synthetic_screen.SyntheticScreen, 'grab', frozen_grab)
+    monkeypatch.setattr(screen_server, 'CAPTURE_SOURCE', 'scroll')
+    monkeypatch.setattr(screen_server, 'SYNTHETIC_RESOLUTION', (320, 240))
+    monkeypatch.setattr(screen_server, 'TARGET_FPS', 30)
+    screen_server.hubs.clear()
+    yield freeze
+    screen_server.hubs.clear()
+
+
+async def open_websocket(port):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'GET /ws?adaptive=0 HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n'
+                 b'Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+                 b'Sec-WebSocket-Version: 13\r\n\r\n')
+    head = await reader.readuntil(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 101')
+    return reader, writer
+
+
+async def read_frame(reader, timeout):
+    """Próximo frame de vídeo: (id, dados do JPEG)"""
+    while True:
+        opcode, payload = await asyncio.wait_for(screen_server.read_ws_message(reader), timeout)
+        if opcode == screen_server.WS_BINARY:
+            frame_id, _ = screen_server.WS_FRAME_HEADER.unpack_from(payload)
+            return frame_id, payload[screen_server.WS_FRAME_HEADER.size:]
+
+
+def send_ack(writer, frame_id):
+    message = json.dumps({'ack': frame_id}).encode('utf-8')
+    writer.write(screen_server.ws_header(screen_server.WS_TEXT, len(message)) + message)
+
+
+def test_ack_delivers_pending_frame_after_screen_goes_static(frozen_screen):
+    async def scenario():
+        port = free_port()
+        server = screen_server.AsyncStreamServer('127.0.0.1', port)
+        serving = asyncio.create_task(server.serve())
+        await asyncio.sleep(0.1)
+        try:
+            reader, writer = await open_websocket(port)
+            sent = [await read_frame(reader, 5) for _ in range(screen_server.WS_WINDOW)]
+
+            # Janela cheia: a tela continua mudando e depois para; o último frame
+            # fica pendente no slot sem nenhuma publicação nova para acordar o envio
+            await asyncio.sleep(0.5)
+            frozen_screen()
+            await asyncio.sleep(0.5)
+
+            send_ack(writer, sent[0][0])
+            frame_id, data = await read_frame(reader, 2)
+            assert frame_id == sent[-1][0] + 1
+            assert data.startswith(b'\xff\xd8')
+
+            writer.close()
+        finally:
+            server.stopped.set()
+            await serving
+
+    asyncio.run(scenario())